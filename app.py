@@ -1,53 +1,55 @@
 import streamlit as st
-from openai import OpenAI
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
-import tempfile
-import json
-
-# ========== v2.2.1 升级：版本号与配置集中管理 ==========
-VERSION = "2.2.1"
-
-CONFIG = {
-    "version": VERSION,
-    "api": {
-        "base_url": "https://api.siliconflow.cn/v1",
-        "timeout": 60
-    },
-    "models": {
-        "transcribe": "FunAudioLLM/SenseVoiceSmall",
-        "generate": "deepseek-ai/DeepSeek-V3"
-    },
-    "theme": {
-        "light": {
-            "bg_primary": "#ffffff",
-            "bg_secondary": "#f0f2f6",
-            "bg_card": "#ffffff",
-            "text_primary": "#1f1f1f",
-            "text_secondary": "#666666",
-            "border_color": "#e0e0e0",
-            "accent_color": "#ff4b4b",
-            "accent_hover": "#ff3333",
-            "shadow": "rgba(0, 0, 0, 0.1)",
-            "input_bg": "#ffffff",
-            "input_text": "#1f1f1f",
-            "button_text": "#ffffff"
-        },
-        "dark": {
-            "bg_primary": "#000000",
-            "bg_secondary": "#1c1c1e",
-            "bg_card": "#2c2c2e",
-            "text_primary": "#ffffff",
-            "text_secondary": "#8e8e93",
-            "border_color": "#38383a",
-            "accent_color": "#0a84ff",
-            "accent_hover": "#409cff",
-            "shadow": "rgba(0, 0, 0, 0.5)",
-            "input_bg": "#1c1c1e",
-            "input_text": "#ffffff",
-            "button_text": "#ffffff"
-        }
-    }
-}
+import io
+import base64
+import time
+import re
+import hashlib
+import functools
+import threading
+from collections import deque
+from datetime import datetime
+
+# 核心模块只在进程内首次运行时真正导入（openai 等重型依赖已改为按需导入）
+_import_start = time.perf_counter()
+from briefing_core import (
+    CONFIG,
+    PROMPTS,
+    SpooledAudio,
+    should_spool,
+    format_bytes,
+    format_timestamp,
+    build_system_prompt,
+    plan_budget,
+    get_metrics,
+    get_transcription_cache,
+    get_generation_cache,
+    get_shared_backend,
+    get_job_manager,
+    get_speculation_stats,
+    start_speculation,
+    settle_speculation,
+    record_briefing,
+    transcribe_job,
+    generate_job,
+    fanout_job,
+    batch_job,
+    build_batch_markdown,
+    build_batch_zip,
+    error_result,
+    stitch_transcripts,
+    get_history_store,
+    record_history,
+    record_startup,
+    startup_timings,
+    warm_up,
+)
+_import_seconds = time.perf_counter() - _import_start
+
+# 整页脚本计时起点（见页面末尾的“脚本耗时”统计）
+_script_start = time.perf_counter()
 
 # ========== 页面设置 ==========
 st.set_page_config(
@@ -56,248 +58,96 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
-# ========== v2.2.1 升级：CSS 变量引用 CONFIG ==========
-st.markdown(f"""
-<style>
-/* ========== 基础变量定义（引用 CONFIG） ========== */
-:root {{
-    --bg-primary: {CONFIG['theme']['light']['bg_primary']};
-    --bg-secondary: {CONFIG['theme']['light']['bg_secondary']};
-    --bg-card: {CONFIG['theme']['light']['bg_card']};
-    --text-primary: {CONFIG['theme']['light']['text_primary']};
-    --text-secondary: {CONFIG['theme']['light']['text_secondary']};
-    --border-color: {CONFIG['theme']['light']['border_color']};
-    --accent-color: {CONFIG['theme']['light']['accent_color']};
-    --accent-hover: {CONFIG['theme']['light']['accent_hover']};
-    --shadow: {CONFIG['theme']['light']['shadow']};
-    --input-bg: {CONFIG['theme']['light']['input_bg']};
-    --input-text: {CONFIG['theme']['light']['input_text']};
-    --button-text: {CONFIG['theme']['light']['button_text']};
-}}
-
-/* ========== iOS 暗黑模式检测 ========== */
-@media (prefers-color-scheme: dark) {{
-    :root {{
-        --bg-primary: {CONFIG['theme']['dark']['bg_primary']};
-        --bg-secondary: {CONFIG['theme']['dark']['bg_secondary']};
-        --bg-card: {CONFIG['theme']['dark']['bg_card']};
-        --text-primary: {CONFIG['theme']['dark']['text_primary']};
-        --text-secondary: {CONFIG['theme']['dark']['text_secondary']};
-        --border-color: {CONFIG['theme']['dark']['border_color']};
-        --accent-color: {CONFIG['theme']['dark']['accent_color']};
-        --accent-hover: {CONFIG['theme']['dark']['accent_hover']};
-        --shadow: {CONFIG['theme']['dark']['shadow']};
-        --input-bg: {CONFIG['theme']['dark']['input_bg']};
-        --input-text: {CONFIG['theme']['dark']['input_text']};
-        --button-text: {CONFIG['theme']['dark']['button_text']};
-    }}
-    
-    /* Streamlit 暗黑模式覆盖 */
-    .stApp {{
-        background-color: var(--bg-primary) !important;
-    }}
-    
-    .stTextInput input, .stTextArea textarea {{
-        background-color: var(--input-bg) !important;
-        color: var(--input-text) !important;
-        border-color: var(--border-color) !important;
-    }}
-    
-    .stSelectbox > div > div {{
-        background-color: var(--bg-card) !important;
-        color: var(--text-primary) !important;
-    }}
-    
-    .stExpander {{
-        background-color: var(--bg-card) !important;
-        border-color: var(--border-color) !important;
-    }}
-    
-    .stMarkdown {{
-        color: var(--text-primary) !important;
-    }}
-    
-    /* 侧边栏暗黑模式 */
-    .css-1d391kg, .css-1lcbmhc {{
-        background-color: var(--bg-secondary) !important;
-    }}
-}}
-
-/* ========== iOS 基础修复 ========== */
-* {{
-    -webkit-tap-highlight-color: transparent;
-    -webkit-touch-callout: none;
-}}
-
-/* ========== 全局样式应用 ========== */
-.stApp {{
-    background-color: var(--bg-primary);
-    color: var(--text-primary);
-    transition: background-color 0.3s ease, color 0.3s ease;
-}}
-
-/* 标题样式 */
-.big-title {{
-    font-size: 32px;
-    font-weight: bold;
-    color: var(--text-primary);
-    margin-bottom: 8px;
-    transition: color 0.3s ease;
-}}
-
-.subtitle {{
-    font-size: 16px;
-    color: var(--text-secondary);
-    margin-bottom: 24px;
-    transition: color 0.3s ease;
-}}
-
-/* 输入框样式 - 自动适应主题 */
-.stTextInput input, .stTextArea textarea {{
-    -webkit-appearance: none !important;
-    -webkit-user-select: text !important;
-    user-select: text !important;
-    font-size: 16px !important;
-    touch-action: manipulation;
-    -webkit-border-radius: 10px;
-    border-radius: 10px;
-    background-color: var(--input-bg);
-    color: var(--input-text);
-    border: 1px solid var(--border-color);
-    transition: all 0.3s ease;
-}}
-
-/* 输入框焦点样式 */
-.stTextInput input:focus, .stTextArea textarea:focus {{
-    outline: none !important;
-    border-color: var(--accent-color) !important;
-    box-shadow: 0 0 0 3px rgba(10, 132, 255, 0.3) !important;
-}}
-
-/* 按钮样式 - 高对比度 */
-.stButton button {{
-    -webkit-appearance: none;
-    touch-action: manipulation;
-    -webkit-border-radius: 10px;
-    border-radius: 10px;
-    background-color: var(--accent-color) !important;
-    color: var(--button-text) !important;
-    border: none !important;
-    font-weight: 600;
-    transition: all 0.2s ease;
-}}
-
-.stButton button:hover {{
-    background-color: var(--accent-hover) !important;
-    transform: translateY(-1px);
-}}
-
-.stButton button:active {{
-    transform: translateY(0);
-}}
-
-/* 卡片/容器样式 */
-.stExpander {{
-    background-color: var(--bg-card);
-    border: 1px solid var(--border-color);
-    border-radius: 12px;
-    overflow: hidden;
-    transition: all 0.3s ease;
-}}
-
-/* 信息框样式 - 暗黑模式适配 */
-.stAlert {{
-    background-color: var(--bg-card) !important;
-    border-color: var(--border-color) !important;
-    color: var(--text-primary) !important;
-}}
-
-.stInfo {{
-    background-color: rgba(10, 132, 255, 0.1) !important;
-    border-left-color: var(--accent-color) !important;
-}}
-
-.stSuccess {{
-    background-color: rgba(48, 209, 88, 0.1) !important;
-    border-left-color: #30d158 !important;
-}}
-
-.stWarning {{
-    background-color: rgba(255, 159, 10, 0.1) !important;
-    border-left-color: #ff9f0a !important;
-}}
-
-.stError {{
-    background-color: rgba(255, 69, 58, 0.1) !important;
-    border-left-color: #ff453a !important;
-}}
-
-/* 文件上传区域 */
-.stFileUploader > div > div {{
-    background-color: var(--bg-secondary) !important;
-    border-color: var(--border-color) !important;
-    color: var(--text-primary) !important;
-}}
-
-/* 分割线 */
-hr {{
-    border-color: var(--border-color) !important;
-}}
-
-/* 下载按钮 */
-.stDownloadButton button {{
-    background-color: var(--bg-card) !important;
-    color: var(--accent-color) !important;
-    border: 2px solid var(--accent-color) !important;
-}}
-
-.stDownloadButton button:hover {{
-    background-color: var(--accent-color) !important;
-    color: var(--button-text) !important;
-}}
-
-/* 侧边栏样式 */
-.css-1d391kg, .css-1lcbmhc, [data-testid="stSidebar"] {{
-    background-color: var(--bg-secondary) !important;
-}}
-
-/* 选择框样式 */
-.stSelectbox > div > div {{
-    background-color: var(--bg-card);
-    border-color: var(--border-color) !important;
-    color: var(--text-primary);
-    border-radius: 10px;
-}}
-
-/* 移动端适配 */
-@media (max-width: 768px) {{
-    .big-title {{ 
-        font-size: 26px !important; 
-    }}
-    .subtitle {{ 
-        font-size: 14px !important; 
-    }}
-    .main .block-container {{ 
-        padding: 1rem; 
-    }}
-    
-    /* iOS 安全区域适配 */
-    .stApp {{
-        padding-bottom: env(safe-area-inset-bottom);
-    }}
-}}
-
-/* 平滑过渡动画 */
-* {{
-    transition: background-color 0.3s ease, color 0.3s ease, border-color 0.3s ease;
-}}
-
-<!-- iOS 状态栏颜色适配 -->
-<meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
-<meta name="theme-color" content="#000000" media="(prefers-color-scheme: dark)">
-<meta name="theme-color" content="#ffffff" media="(prefers-color-scheme: light)">
-</style>
-""", unsafe_allow_html=True)
+# ========== 冷启动：进程级一次性初始化 ==========
+@st.cache_resource
+def start_warm_up() -> threading.Thread:
+    """进程内首次渲染完成后在后台预热（导入 openai、创建连接池并预先建立连接）
+    
+    放在页面末尾启动：导入 openai 占用 CPU，与首次渲染并行会拖慢首屏。
+    """
+    thread = threading.Thread(target=warm_up, kwargs={"connect": True}, name="briefing-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+record_startup("导入 briefing_core", _import_seconds)
+
+# ========== 主题样式：按 CONFIG 构建一次，静态文件服务 ==========
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# iOS 状态栏颜色适配
+THEME_META = (
+    '<meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">'
+    '<meta name="theme-color" content="#000000" media="(prefers-color-scheme: dark)">'
+    '<meta name="theme-color" content="#ffffff" media="(prefers-color-scheme: light)">'
+)
+
+
+def theme_variables(palette: dict) -> str:
+    """CONFIG 主题色 → CSS 变量声明（bg_primary → --bg-primary）"""
+    return ":root {" + "".join(f"--{name.replace('_', '-')}: {value};" for name, value in palette.items()) + "}"
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+@st.cache_resource
+def build_theme() -> dict:
+    """构建主题样式表：CONFIG 变量 + assets/theme.css，压缩后按内容哈希写入 static/
+    
+    文件名带哈希，浏览器可长期缓存；每次 rerun 只需发送一个 <link> 标签。
+    """
+    with open(os.path.join(APP_DIR, "assets", "theme.css"), encoding="utf-8") as f:
+        source = f.read()
+    theme = CONFIG['theme']
+    full = (
+        theme_variables(theme['light'])
+        + "@media (prefers-color-scheme: dark) {" + theme_variables(theme['dark']) + "}\n"
+        + source
+    )
+    css = minify_css(full)
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+    filename = f"theme.{digest}.css"
+    
+    static_dir = os.path.join(APP_DIR, "static")
+    path = os.path.join(static_dir, filename)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(static_dir, exist_ok=True)
+            # 先写临时文件再改名，避免多进程同时构建时读到半个文件
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(css)
+            os.replace(tmp_path, path)
+            for old in os.listdir(static_dir):
+                if old.startswith("theme.") and old.endswith(".css") and old != filename:
+                    os.remove(os.path.join(static_dir, old))
+        written = True
+    except OSError:
+        written = False
+    
+    return {
+        "hash": digest,
+        "link": f'<link rel="stylesheet" href="app/static/{filename}">' + THEME_META if written else None,
+        "inline": f"<style>{css}</style>" + THEME_META,
+        # 改造前每次 rerun 发送未压缩的完整样式
+        "legacy_bytes": len(f"<style>{full}</style>".encode("utf-8")) + len(THEME_META.encode("utf-8"))
+    }
+
+
+def inject_theme() -> dict:
+    """注入主题样式：开启静态文件服务时只发送 <link>，否则内联压缩后的样式；返回本次发送的字节数"""
+    theme = build_theme()
+    markup = theme["link"] if theme["link"] and st.get_option("server.enableStaticServing") else theme["inline"]
+    st.markdown(markup, unsafe_allow_html=True)
+    return {"sent": len(markup.encode("utf-8")), "legacy": theme["legacy_bytes"], "static": markup == theme["link"]}
+
+
+theme_stats = inject_theme()
 
 # ========== 标题 ==========
 st.markdown('<p class="big-title">🎙️ AI语音简报助手</p>', unsafe_allow_html=True)
@@ -337,8 +187,55 @@ if not api_key:
                 else:
                     st.error("❌ 请输入正确的 API 密钥（以 sk- 开头）")
     
+    record_startup("首次渲染（密钥页）", time.perf_counter() - _script_start)
+    start_warm_up()
     st.stop()
 
+# ========== 历史记录 ==========
+def load_history(entry: dict):
+    """载入历史记录：直接恢复转写与简报，不调用 API"""
+    st.session_state.transcribed_text = entry["transcript"]
+    st.session_state.history_id = entry["id"]
+    st.session_state.pop("transcript_segments", None)
+    st.session_state.pop("preprocess_info", None)
+    st.session_state.pop("fanout_results", None)
+    if entry["result"]:
+        st.session_state.generated_result = entry["result"]
+        st.session_state.generation_stats = {"from_history": entry["created"]}
+        st.session_state.briefing_type = entry["briefing_type"]
+        st.session_state.custom_req = entry["custom_req"] or ""
+    else:
+        st.session_state.pop("generated_result", None)
+        st.session_state.pop("generation_stats", None)
+
+
+def history_panel():
+    """侧边栏历史记录：全文检索转写与简报，点击载入"""
+    store = get_history_store()
+    if store is None:
+        return
+    
+    with st.expander("🕘 历史记录"):
+        query = st.text_input("搜索", placeholder="关键词，空格分隔", key="history_query", label_visibility="collapsed")
+        start = time.perf_counter()
+        entries = store.search(query, CONFIG['history']['search_limit'])
+        elapsed = (time.perf_counter() - start) * 1000
+        if query:
+            st.caption(f"🔍 {len(entries)} 条结果 · {elapsed:.1f} ms")
+        elif not entries:
+            st.caption("暂无记录")
+        
+        for entry in entries:
+            created = datetime.fromtimestamp(entry["created"]).strftime("%m-%d %H:%M")
+            title = entry["briefing_type"] or "转写"
+            source = f" · {entry['source']}" if entry["source"] else ""
+            preview = entry["snippet"] or (entry["result"] or entry["transcript"])[:40]
+            st.markdown(f"**{created} · {title}**{source}  \n{preview}")
+            if st.button("载入", key=f"history_load_{entry['id']}"):
+                load_history(entry)
+                st.rerun()
+
+
 # ========== 侧边栏 ==========
 with st.sidebar:
     st.header("⚙️ 设置")
@@ -348,133 +245,496 @@ with st.sidebar:
         del st.session_state.api_key
         st.rerun()
     
+    st.toggle(
+        "⚡ 流式生成",
+        value=CONFIG['generate']['stream'],
+        key="stream_mode",
+        help="边生成边显示，无需等待完整结果"
+    )
+    
+    st.toggle(
+        "🔮 预生成简报",
+        value=CONFIG['generate']['speculative'],
+        key="speculative_mode",
+        help="转写完成后立即按当前简报类型在后台生成；内容与设置未改动时点击生成直接复用，改动则取消"
+    )
+    
+    history_panel()
+    
+    # 缓存统计在页面末尾填充，确保显示本次运行后的最新计数
+    cache_stats_slot = st.empty()
+    
     st.divider()
     st.caption(f"💡 AI简报_分享版 v{CONFIG['version']}")
 
-# ========== v2.2.1 升级：提取 OpenAI 客户端初始化函数 ==========
-@st.cache_resource
-def get_openai_client(api_key: str) -> OpenAI:
-    """获取 OpenAI 客户端（带缓存）"""
-    return OpenAI(
-        api_key=api_key,
-        base_url=CONFIG['api']['base_url'],
-        timeout=CONFIG['api']['timeout']
+def submit_batch(uploaded_files: list, api_key: str):
+    """提交批量任务，使用当前选择的简报类型与特殊要求；大文件或超出会话内存上限的文件先落盘"""
+    held = session_audio_bytes()
+    files = []
+    for f in uploaded_files:
+        if should_spool(f.size, held):
+            audio = SpooledAudio.spool(f, suffix=os.path.splitext(f.name)[1].lower())
+        else:
+            audio = f.getvalue()
+            held += len(audio)
+        files.append((f.name, audio, f.type or "application/octet-stream"))
+    briefing_type = st.session_state.get("briefing_type", "会议纪要")
+    job = get_job_manager().submit(
+        "batch", batch_job,
+        files, api_key, briefing_type, st.session_state.get("custom_req", ""),
+        label=f"{len(files)} 个文件"
     )
+    hold_audio(job.id, sum(len(audio) for _, audio, _ in files if isinstance(audio, bytes)))
+    st.session_state.batch_job_id = job.id
+    st.session_state.batch_briefing_type = briefing_type
+    st.session_state.pop("batch_results", None)
 
-# ========== v2.2.1 升级：错误分类处理 ==========
-def classify_error(error: Exception) -> dict:
-    """分类错误类型"""
-    error_str = str(error).lower()
-    
-    # 认证错误
-    if any(kw in error_str for kw in ['401', 'unauthorized', 'invalid api key', 'authentication']):
-        return {
-            "type": "auth",
-            "title": "🔐 认证失败",
-            "message": "API 密钥无效或已过期，请检查密钥是否正确",
-            "action": "更换密钥"
-        }
-    
-    # 网络错误
-    elif any(kw in error_str for kw in ['connection', 'timeout', 'network', 'dns', '404', '503']):
-        return {
-            "type": "network",
-            "title": "📡 网络错误",
-            "message": "无法连接到服务器，请检查网络连接或稍后重试",
-            "action": "重试"
-        }
-    
-    # 格式/参数错误
-    elif any(kw in error_str for kw in ['400', 'bad request', 'invalid', 'format']):
-        return {
-            "type": "format",
-            "title": "⚠️ 请求格式错误",
-            "message": "音频格式不支持或文件损坏，请尝试其他文件",
-            "action": "更换文件"
-        }
+
+_BATCH_STAGE_ICONS = {"排队中": "⏳", "转写中": "🎧", "生成中": "🤖", "完成": "✅", "失败": "❌", "转写为空": "⚠️", "已取消": "⏹️"}
+
+def batch_job_panel():
+    """批量任务状态：逐文件显示进度，完成后写回结果"""
+    job_id = st.session_state.get("batch_job_id")
+    job = get_job_manager().get(job_id) if job_id else None
+    if job_id and (job is None or job.done):
+        del st.session_state.batch_job_id
+        release_audio(job_id)
+        if job is not None and job.status == "done":
+            st.session_state.batch_results = job.result
+        elif job is not None and job.status == "failed":
+            st.session_state.transcribe_error = error_result(job.error)
+        st.rerun()
+    if job is None:
+        return
     
-    # 配额/限制错误
-    elif any(kw in error_str for kw in ['429', 'quota', 'rate limit', 'insufficient']):
-        return {
-            "type": "quota",
-            "title": "💰 额度不足",
-            "message": "API 调用额度已用完或请求过于频繁",
-            "action": "检查额度"
-        }
+    done, total = job.progress or (0, len(getattr(job, "items", [])) or 1)
+    st.progress(done / total, text=f"📚 批量处理 {done}/{total}")
+    for item in getattr(job, "items", []):
+        st.caption(f"{_BATCH_STAGE_ICONS.get(item['stage'], '')} {item['name']} · {item['stage']}")
+    if st.button("⏹️ 取消批量", key=f"cancel_{job.id}"):
+        job.cancel()
+
+
+def show_error(result: dict, key: str):
+    """根据错误类型显示不同提示（v2.2.1 错误分类）"""
+    error_type = result.get("error_type", "unknown")
+    error_title = result.get("error_title", "错误")
+    error_message = result.get("error_message", result["error_raw"])
     
-    # 未知错误
+    if error_type == "auth":
+        st.error(f"{error_title}：{error_message}")
+        if st.button("🔄 重新输入密钥", key=key):
+            del st.session_state.api_key
+            st.rerun()
+    elif error_type in ("network", "format"):
+        st.warning(f"{error_title}：{error_message}")
     else:
-        return {
-            "type": "unknown",
-            "title": "❌ 未知错误",
-            "message": f"发生未知错误：{str(error)}",
-            "action": "重试"
-        }
+        st.error(f"{error_title}：{error_message}")
 
-# ========== 语音转文字函数（v2.2.1 升级：使用统一客户端 + 错误分类） ==========
-def transcribe_audio(audio_bytes: bytes, api_key: str) -> dict:
-    tmp_path = None
-    try:
-        client = get_openai_client(api_key)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
-        
-        with open(tmp_path, "rb") as audio:
-            transcription = client.audio.transcriptions.create(
-                model=CONFIG['models']['transcribe'],
-                file=audio,
-                response_format="text"
-            )
-            
-            # 处理返回结果（保持 v2.2.0 清洗逻辑）
-            result_text = ""
-            
-            if hasattr(transcription, 'text'):
-                result_text = transcription.text
-            elif isinstance(transcription, str):
-                result_text = transcription.strip()
-                
-                if result_text.startswith('{') and result_text.endswith('}'):
-                    try:
-                        json_data = json.loads(result_text)
-                        if 'text' in json_data:
-                            result_text = json_data['text']
-                    except json.JSONDecodeError:
-                        pass
-                
-                elif result_text.lower().startswith('text='):
-                    result_text = result_text[5:]
+
+def poll_interval(active: bool):
+    """有进行中的任务时才开启片段定时刷新"""
+    return CONFIG['jobs']['poll_interval'] if active else None
+
+
+def submit_transcription(audio, api_key: str, filename: str, mime_type: str):
+    """提交后台转写任务，任务 ID 记入 session_state；内存中的音频超出会话上限时先落盘"""
+    if isinstance(audio, bytes) and should_spool(len(audio), session_audio_bytes()):
+        audio = SpooledAudio.spool(io.BytesIO(audio), suffix=os.path.splitext(filename)[1].lower())
+    job = get_job_manager().submit(
+        "transcribe", transcribe_job, audio, api_key, filename, mime_type, label=filename
+    )
+    if isinstance(audio, bytes):
+        hold_audio(job.id, len(audio))
+    st.session_state.setdefault("transcribe_jobs", []).append(job.id)
+    st.session_state.pop("transcribe_error", None)
+    return job
+
+
+# ========== 大文件上传：落盘暂存 + 会话内存上限 ==========
+def session_audio_bytes() -> int:
+    """本会话后台任务仍在内存中持有的音频字节数"""
+    return sum(st.session_state.get("audio_memory", {}).values())
+
+
+def hold_audio(job_id: str, size: int):
+    if size:
+        st.session_state.setdefault("audio_memory", {})[job_id] = size
+
+
+def release_audio(job_id: str):
+    st.session_state.get("audio_memory", {}).pop(job_id, None)
+
+
+# 暂存文件回放时整体载入 Streamlit 媒体存储，仅在面板渲染期间计入会话内存
+PLAYBACK_HOLD = "spooled_playback"
+
+
+def spool_upload(audio_file):
+    """上传文件分块落盘到私有暂存目录，随后从 Streamlit 上传管理器中移除并重置上传控件，内存中不再保留副本"""
+    st.session_state.spooled_upload = {
+        "audio": SpooledAudio.spool(audio_file, suffix=os.path.splitext(audio_file.name)[1].lower()),
+        "name": audio_file.name,
+        "type": audio_file.type or "application/octet-stream"
+    }
+    ctx = get_script_run_ctx()
+    remove_file = getattr(ctx.uploaded_file_mgr, "remove_file", None) if ctx else None
+    if remove_file is not None:
+        remove_file(session_id=ctx.session_id, file_id=audio_file.file_id)
+    st.session_state.upload_nonce = st.session_state.get("upload_nonce", 0) + 1
+    st.rerun()
+
+
+def spooled_upload_panel(api_key: str):
+    """已落盘的上传：转写时按块读取，转写结束即删除暂存文件"""
+    spooled = st.session_state.spooled_upload
+    audio = spooled["audio"]
+    running = "job_id" in spooled
+    st.caption(f"💾 {spooled['name']}（{format_bytes(len(audio))}）已暂存到磁盘，转写时按块读取，不占用会话内存")
+    # 回放需把整个文件载入 Streamlit 的媒体存储：计入会话内存，超出上限时不提供
+    if not running:
+        if should_spool(len(audio), session_audio_bytes()):
+            st.caption("🔇 文件过大，回放需整体载入内存，已停用")
+        elif st.toggle("🔊 回放（载入内存）", key="spooled_playback"):
+            hold_audio(PLAYBACK_HOLD, len(audio))
+            st.audio(audio.path, format=spooled["type"])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🎯 开始转写", type="primary", key="transcribe_spooled", disabled=running, use_container_width=True):
+            spooled["job_id"] = submit_transcription(audio, api_key, spooled["name"], spooled["type"]).id
+            st.rerun()
+    with col2:
+        # 转写进行中时只解除会话引用，暂存文件由任务结束时删除
+        if st.button("🗑️ 换一个文件", key="discard_spooled", use_container_width=True):
+            del st.session_state.spooled_upload
+            if not running:
+                audio.remove()
+            st.rerun()
+
+
+def speculate(content: str):
+    """转写完成后按当前简报类型与特殊要求预生成（开启预生成时）"""
+    discard_speculation()
+    if not st.session_state.get("speculative_mode") or not content.strip():
+        return
+    briefing_type = st.session_state.get("briefing_type", "会议纪要")
+    custom_req = st.session_state.get("custom_req", "")
+    job = start_speculation(
+        api_key, briefing_type, custom_req, content,
+        stream=st.session_state.get("stream_mode", CONFIG['generate']['stream'])
+    )
+    st.session_state.speculation = {
+        "job_id": job.id, "content": content, "briefing_type": briefing_type, "custom_req": custom_req
+    }
+
+
+def discard_speculation():
+    """内容或设置已改动：取消预生成（已完成则计为浪费）"""
+    spec = st.session_state.pop("speculation", None)
+    if spec:
+        settle_speculation(
+            get_job_manager().get(spec["job_id"]), False,
+            spec["briefing_type"], spec["custom_req"], spec["content"]
+        )
+
+
+def adopt_speculation(content: str, briefing_type: str, custom_req: str) -> bool:
+    """点击生成时内容与设置均未改动，则把预生成任务作为本次生成任务"""
+    spec = st.session_state.get("speculation")
+    if not spec or (spec["content"], spec["briefing_type"], spec["custom_req"]) != (content, briefing_type, custom_req):
+        return False
+    job = get_job_manager().get(spec["job_id"])
+    if job is None or job.status in ("failed", "cancelled"):
+        return False
+    del st.session_state.speculation
+    settle_speculation(job, True, briefing_type, custom_req, content)
+    st.session_state.generate_job_id = job.id
+    st.session_state.adopted_speculation = spec
+    return True
+
+
+def transcribe_jobs_panel():
+    """转写任务状态：轮询进度，完成后写回转写文本"""
+    manager = get_job_manager()
+    finished = False
+    for job_id in list(st.session_state.get("transcribe_jobs", [])):
+        job = manager.get(job_id)
+        if job is None or job.done:
+            st.session_state.transcribe_jobs.remove(job_id)
+            release_audio(job_id)
+            if st.session_state.get("spooled_upload", {}).get("job_id") == job_id:
+                # 暂存文件已随任务结束删除
+                del st.session_state.spooled_upload
+            finished = True
+            if job is None or job.status == "cancelled":
+                continue
+            result = job.result if job.status == "done" else error_result(job.error)
+            if not result["success"]:
+                st.session_state.transcribe_error = result
+            elif not result["text"].strip():
+                st.session_state.transcribe_notice = ("warning", f"⚠️ {job.label} 转写结果为空，请检查录音是否清晰")
             else:
-                result_text = str(transcription)
-            
-            result_text = result_text.strip().strip("'\"").strip()
-            
-            if result_text.lower() == 'text':
-                result_text = ""
+                st.session_state.transcribed_text = result["text"]
+                st.session_state.preprocess_info = result.get("preprocess")
+                st.session_state.transcript_segments = result.get("segments") or []
+                st.session_state.history_id = result.get("history_id")
+                st.session_state.transcribe_notice = ("success", f"✅ 转写完成！共 {len(result['text'])} 字")
+                speculate(result["text"])
+            continue
         
-        return {"success": True, "text": result_text}
-        
-    except Exception as e:
-        error_info = classify_error(e)
-        return {
-            "success": False, 
-            "error_type": error_info["type"],
-            "error_title": error_info["title"],
-            "error_message": error_info["message"],
-            "error_action": error_info["action"],
-            "error_raw": str(e)
+        if job.progress:
+            done, total = job.progress
+            st.progress(done / total, text=f"🤖 {job.label} 分段转写 {done}/{total}")
+        else:
+            st.info(f"🤖 {job.label} {job.stage}...")
+    
+    if finished:
+        st.rerun()
+
+
+def generate_job_panel():
+    """生成任务状态：轮询显示部分结果，完成后写回简报"""
+    job_id = st.session_state.get("generate_job_id")
+    job = get_job_manager().get(job_id) if job_id else None
+    if job_id and (job is None or job.done):
+        del st.session_state.generate_job_id
+        spec = st.session_state.pop("adopted_speculation", None)
+        if job is not None and job.status == "done" and job.kind == "fanout":
+            st.session_state.fanout_results = job.result
+            st.session_state.history_id = next(
+                (stats["history_id"] for _, stats in job.result.values() if stats.get("history_id")),
+                st.session_state.get("history_id")
+            )
+            st.session_state.pop("generated_result", None)
+            st.session_state.pop("generation_stats", None)
+        elif job is not None and job.status == "done":
+            st.session_state.pop("fanout_results", None)
+            st.session_state.generated_result, st.session_state.generation_stats = job.result
+            if spec is not None and spec["job_id"] == job_id:
+                # 预生成任务不写历史，被采用后补写
+                st.session_state.generation_stats["speculative"] = True
+                st.session_state.generation_stats["history_id"] = record_briefing(
+                    st.session_state.get("history_id"), spec["content"],
+                    spec["briefing_type"], spec["custom_req"], st.session_state.generated_result,
+                    cached=st.session_state.generation_stats.get("cached", False)
+                )
+            st.session_state.history_id = st.session_state.generation_stats.get("history_id")
+        elif job is not None and job.status == "failed":
+            st.session_state.generate_error = error_result(job.error)
+        st.rerun()
+    if job is None:
+        return
+    
+    col_status, col_cancel = st.columns([3, 1])
+    with col_status:
+        if job.progress:
+            done, total = job.progress
+            st.progress(done / total, text=f"🧩 {job.stage} {done}/{total}")
+        else:
+            st.info(f"🤖 {job.stage}...")
+    with col_cancel:
+        if st.button("⏹️ 取消", key=f"cancel_{job.id}", use_container_width=True):
+            job.cancel()
+    if job.partial:
+        st.markdown(job.partial + "▌")
+    partials = getattr(job, "partials", None)
+    if partials:
+        for tab, (briefing_type, partial) in zip(st.tabs(list(partials)), partials.items()):
+            with tab:
+                st.markdown(partial + "▌")
+
+
+def show_generation_stats(stats: dict):
+    """生成结果的来源与耗时说明"""
+    if stats.get("from_history"):
+        st.caption(f"🕘 载入自历史记录（{datetime.fromtimestamp(stats['from_history']).strftime('%Y-%m-%d %H:%M')}），未调用 API")
+    elif stats.get("speculative"):
+        st.caption("🔮 复用转写完成时的预生成结果")
+    elif stats.get("cached"):
+        st.caption("⚡ 命中缓存，未调用 API")
+    elif "ttft" in stats:
+        st.caption(f"⏱️ 首字 {stats['ttft']:.2f}s · 总耗时 {stats.get('total', 0):.2f}s")
+    elif "total" in stats:
+        st.caption(f"⏱️ 总耗时 {stats['total']:.2f}s")
+    if stats.get("cached_tokens"):
+        st.caption(f"♻️ 共享前缀命中服务端缓存 {stats['cached_tokens']} tokens")
+    if "segments" in stats:
+        st.caption(f"🧩 分段提炼 {stats['segments']} 段 · 耗时 {stats['map']:.2f}s")
+    if stats.get("budget_warning"):
+        st.warning(f"⚠️ {stats['budget_warning']}，结果可能不完整")
+
+# ========== 边录边转：滚动窗口实时转写 ==========
+@st.cache_resource
+def live_recorder_component():
+    """声明边录边转组件（进程内一次，避免每次 rerun 重新注册）"""
+    return components.declare_component(
+        "live_recorder",
+        path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "live_recorder")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_mic_recorder():
+    """按需导入录音组件（仅在未开启边录边转时用到）；导入失败抛 ImportError"""
+    from streamlit_mic_recorder import mic_recorder
+    return mic_recorder
+
+
+def submit_live_windows(value: dict, api_key: str):
+    """录音组件发来新窗口时逐个提交后台转写；新的录音会话从当前文本末尾续写"""
+    if not value or not value.get("session"):
+        return
+    live = st.session_state.get("live_transcription")
+    if live is None or live["session"] != value["session"]:
+        live = {
+            "session": value["session"],
+            "prefix": st.session_state.get("transcribed_text", ""),
+            "jobs": [],
+            "texts": {},
+            "stopped": False,
+            "done": False
         }
+        st.session_state.live_transcription = live
+        st.session_state.pop("transcribe_error", None)
+        st.session_state.pop("transcript_segments", None)
     
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    cfg = CONFIG['live']
+    for window in value["windows"]:
+        # 组件会重发未确认的窗口，只处理下一个序号
+        if window["seq"] != len(live["jobs"]):
+            continue
+        duration = window["end"] - window["start"]
+        if duration <= 0 or (window["final"] and duration < cfg['overlap_seconds'] + cfg['min_tail_seconds']):
+            live["jobs"].append(None)       # 空窗口，或停止时只剩重叠部分，无需转写
+        else:
+            job = get_job_manager().submit(
+                "transcribe", transcribe_job,
+                base64.b64decode(window["audio"]), api_key, f"live_{window['seq']}.wav", "audio/wav",
+                history=False, label=f"实时片段 {window['seq'] + 1}"
+            )
+            live["jobs"].append(job.id)
+        live["stopped"] = live["stopped"] or window["final"]
 
-# ========== 主界面 ==========
-col1, col2 = st.columns([1, 1])
 
-with col1:
+def live_transcription_panel():
+    """实时转写状态：按顺序收集已完成的窗口，拼接后续写到转写文本"""
+    live = st.session_state.get("live_transcription")
+    if not live or live["done"]:
+        return
+    
+    manager = get_job_manager()
+    changed = False
+    for seq, job_id in enumerate(live["jobs"]):
+        if seq in live["texts"]:
+            continue
+        job = manager.get(job_id) if job_id else None
+        if job is not None and not job.done:
+            continue
+        text = ""
+        if job is not None and job.status in ("done", "failed"):
+            result = job.result if job.status == "done" else error_result(job.error)
+            if result["success"]:
+                text = result["text"]
+            else:
+                st.session_state.transcribe_error = result
+        live["texts"][seq] = text
+        changed = True
+    
+    if changed:
+        # 只拼接连续完成的窗口，避免中间缺段
+        ready = 0
+        while ready in live["texts"]:
+            ready += 1
+        cfg = CONFIG['long_audio']
+        stitched = stitch_transcripts(
+            [live["texts"][i] for i in range(ready)], cfg['stitch_window'], cfg['stitch_min_match']
+        )
+        prefix = live["prefix"].rstrip()
+        st.session_state.transcribed_text = f"{prefix}\n{stitched}" if prefix and stitched else prefix or stitched
+    
+    total = len(live["jobs"])
+    if live["stopped"] and len(live["texts"]) == total:
+        live["done"] = True
+        if st.session_state.get("transcribed_text", "").strip():
+            st.session_state.history_id = record_history(
+                transcript=st.session_state.transcribed_text, source="边录边转"
+            )
+        st.session_state.transcribe_notice = ("success", f"✅ 实时转写完成！共 {total} 段")
+        speculate(st.session_state.get("transcribed_text", ""))
+        st.rerun()
+    if changed:
+        st.rerun()
+    if total:
+        state = "⏳ 收尾中" if live["stopped"] else "🔴 录音中"
+        st.caption(f"{state} · 已转写 {len(live['texts'])}/{total} 段")
+
+
+# ========== 脚本耗时：整页 rerun 与片段 rerun 分开统计 ==========
+# 片段单独重跑时此标记为 False（整页运行开始时置 True，结束时复位）
+_full_run = True
+
+
+def record_timing(scope: str, seconds: float):
+    timings = st.session_state.setdefault("script_timings", {})
+    timings.setdefault(scope, deque(maxlen=200)).append(seconds * 1000)
+
+
+def timed_fragment(scope: str):
+    """片段单独重跑时记录执行耗时（随整页运行的那次计入整页）"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if not _full_run:
+                    record_timing(scope, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def timing_rows() -> list:
+    rows = []
+    for scope, samples in st.session_state.get("script_timings", {}).items():
+        ordered = sorted(samples)
+        rows.append({
+            "范围": scope,
+            "次数": len(ordered),
+            "p50 (ms)": round(ordered[len(ordered) // 2], 1),
+            "最大 (ms)": round(ordered[-1], 1)
+        })
+    return rows
+
+
+def markdown_table(rows: list) -> str:
+    """侧边栏小型统计表渲染为 Markdown 表格（st.dataframe 首次使用会导入 pandas，冷启动多约 0.5 秒）"""
+    headers = list(dict.fromkeys(key for row in rows for key in row))
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    for row in rows:
+        lines.append("| " + " | ".join("" if row.get(key) is None else str(row.get(key)) for key in headers) + " |")
+    return "\n".join(lines)
+
+
+def clear_editor():
+    """清空按钮回调：取消生成并清除文本与结果（回调先于片段重跑执行，无需 st.rerun）"""
+    running = get_job_manager().get(st.session_state.pop("generate_job_id", ""))
+    if running is not None:
+        running.cancel()
+    discard_speculation()
+    st.session_state.transcribed_text = ""
+    for key in (
+        "transcript_segments", "history_id", "generated_result", "generation_stats", "fanout_results", "generate_error"
+    ):
+        st.session_state.pop(key, None)
+
+
+# ========== 主界面 ==========
+# 左右两栏各自为片段：栏内交互只重跑本栏；转写/生成完成等跨栏更新才整页重跑
+@st.fragment
+@timed_fragment("🎤 语音输入片段")
+def voice_input_pane():
     st.subheader("🎤 语音输入")
     
     # 方式一：实时录音
@@ -491,48 +751,38 @@ with col1:
     </div>
     """, unsafe_allow_html=True)
     
+    live_mode = st.toggle(
+        "⚡ 边录边转",
+        key="live_mode",
+        help=f"录音期间每 {CONFIG['live']['window_seconds']} 秒转写一段，停止时转写基本已完成"
+    )
+    
     try:
-        from streamlit_mic_recorder import mic_recorder
-        
-        audio = mic_recorder(
-            start_prompt="🎙️ 点击录音",
-            stop_prompt="⏹️ 点击停止",
-            just_once=True,
-            key="mic_recorder_ios_v2"
-        )
-        
-        if audio and audio.get("bytes"):
-            with st.spinner("🤖 AI正在转写..."):
-                result = transcribe_audio(audio["bytes"], api_key)
-                
-                if result["success"]:
-                    clean_text = result["text"]
-                    if not clean_text or clean_text.strip() == "":
-                        st.warning("⚠️ 转写结果为空，请检查录音是否清晰")
-                    else:
-                        st.session_state.transcribed_text = clean_text
-                        st.success(f"✅ 转写完成！共 {len(clean_text)} 字")
-                        st.rerun()
-                else:
-                    # v2.2.1 升级：根据错误类型显示不同提示
-                    error_type = result.get("error_type", "unknown")
-                    error_title = result.get("error_title", "错误")
-                    error_message = result.get("error_message", result["error_raw"])
-                    
-                    if error_type == "auth":
-                        st.error(f"{error_title}：{error_message}")
-                        if st.button("🔄 重新输入密钥", key="reauth_mic"):
-                            del st.session_state.api_key
-                            st.rerun()
-                    elif error_type == "network":
-                        st.warning(f"{error_title}：{error_message}")
-                    elif error_type == "format":
-                        st.warning(f"{error_title}：{error_message}")
-                    elif error_type == "quota":
-                        st.error(f"{error_title}：{error_message}")
-                    else:
-                        st.error(f"{error_title}：{error_message}")
-                    
+        if live_mode:
+            live = st.session_state.get("live_transcription") or {}
+            value = live_recorder_component()(
+                window_seconds=CONFIG['live']['window_seconds'],
+                overlap_seconds=CONFIG['live']['overlap_seconds'],
+                acked=len(live.get("jobs", [])) - 1,
+                acked_session=live.get("session"),
+                key="live_recorder",
+                default=None
+            )
+            submit_live_windows(value, api_key)
+            live = st.session_state.get("live_transcription")
+            st.fragment(run_every=poll_interval(bool(live) and not live["done"]))(live_transcription_panel)()
+        else:
+            audio = load_mic_recorder()(
+                start_prompt="🎙️ 点击录音",
+                stop_prompt="⏹️ 点击停止",
+                just_once=True,
+                key="mic_recorder_ios_v2"
+            )
+            
+            if audio and audio.get("bytes"):
+                audio_format = audio.get("format", "webm")
+                submit_transcription(audio["bytes"], api_key, f"recording.{audio_format}", f"audio/{audio_format}")
+    
     except ImportError:
         st.error("⚠️ 录音组件加载失败，请使用方式二上传文件")
     except Exception as e:
@@ -551,53 +801,81 @@ with col1:
     3. 在这里选择文件上传
     """)
     
-    audio_file = st.file_uploader(
-        "选择录音文件", 
-        type=['mp3', 'wav', 'm4a', 'webm', 'ogg'],
-        help="支持 mp3, wav, m4a, webm, ogg 格式"
-    )
+    batch_mode = st.toggle("📚 批量模式", help="一次上传多个录音，并发转写并生成简报", key="batch_mode")
     
-    if audio_file:
-        st.audio(audio_file, format=f'audio/{audio_file.type.split("/")[1]}')
+    # 回放占用每次运行重新计入：面板未渲染（已删除、已转写或切到批量模式）时随即释放
+    release_audio(PLAYBACK_HOLD)
+    if batch_mode:
+        batch_files = st.file_uploader(
+            "选择多个录音文件",
+            type=['mp3', 'wav', 'm4a', 'webm', 'ogg'],
+            accept_multiple_files=True,
+            key="batch_uploader",
+            help="按上传顺序处理，同时处理的文件数见 CONFIG['batch']"
+        )
         
-        if st.button("🎯 开始转写", type="primary", key="transcribe_upload"):
-            with st.spinner("🤖 正在识别..."):
-                result = transcribe_audio(audio_file.getvalue(), api_key)
-                
-                if result["success"]:
-                    clean_text = result["text"]
-                    if not clean_text or clean_text.strip() == "":
-                        st.warning("⚠️ 转写结果为空，请检查音频文件")
-                    else:
-                        st.session_state.transcribed_text = clean_text
-                        st.success(f"✅ 完成！共 {len(clean_text)} 字")
-                        st.rerun()
-                else:
-                    # v2.2.1 升级：根据错误类型显示不同提示
-                    error_type = result.get("error_type", "unknown")
-                    error_title = result.get("error_title", "错误")
-                    error_message = result.get("error_message", result["error_raw"])
-                    
-                    if error_type == "auth":
-                        st.error(f"{error_title}：{error_message}")
-                        if st.button("🔄 重新输入密钥", key="reauth_upload"):
-                            del st.session_state.api_key
-                            st.rerun()
-                    elif error_type == "network":
-                        st.warning(f"{error_title}：{error_message}")
-                    elif error_type == "format":
-                        st.warning(f"{error_title}：{error_message}")
-                    elif error_type == "quota":
-                        st.error(f"{error_title}：{error_message}")
-                    else:
-                        st.error(f"{error_title}：{error_message}")
+        if batch_files and st.button(f"🚀 批量转写并生成（{len(batch_files)} 个文件）", type="primary", key="batch_start"):
+            submit_batch(batch_files, api_key)
+        
+        st.fragment(run_every=poll_interval("batch_job_id" in st.session_state))(batch_job_panel)()
+    elif "spooled_upload" in st.session_state:
+        spooled_upload_panel(api_key)
+    else:
+        audio_file = st.file_uploader(
+            "选择录音文件", 
+            type=['mp3', 'wav', 'm4a', 'webm', 'ogg'],
+            key=f"audio_uploader_{st.session_state.get('upload_nonce', 0)}",
+            help=f"支持 mp3, wav, m4a, webm, ogg 格式；超过 {format_bytes(CONFIG['upload']['spool_threshold'])} 的文件暂存到磁盘"
+        )
+    
+        if audio_file and should_spool(audio_file.size, session_audio_bytes()):
+            spool_upload(audio_file)
+        if audio_file:
+            st.audio(audio_file, format=f'audio/{audio_file.type.split("/")[1]}')
+        
+            if st.button("🎯 开始转写", type="primary", key="transcribe_upload"):
+                submit_transcription(
+                    audio_file.getvalue(),
+                    api_key,
+                    audio_file.name,
+                    audio_file.type or "application/octet-stream"
+                )
+    
+    
+    # 转写在后台执行，期间可继续录音、编辑或生成
+    st.fragment(run_every=poll_interval(bool(st.session_state.get("transcribe_jobs"))))(transcribe_jobs_panel)()
+    
+    notice = st.session_state.pop("transcribe_notice", None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+    if "transcribe_error" in st.session_state:
+        show_error(st.session_state.transcribe_error, key="reauth_transcribe")
+    
+    preprocess_info = st.session_state.get("preprocess_info")
+    if preprocess_info:
+        st.caption(
+            f"📦 音频预处理：{format_bytes(preprocess_info['before'])} → "
+            f"{format_bytes(preprocess_info['after'])}"
+            f"（{preprocess_info['before'] / max(preprocess_info['after'], 1):.1f}×）"
+        )
+    
+    segments = st.session_state.get("transcript_segments")
+    if segments:
+        with st.expander(f"🕒 分句时间轴（{len(segments)} 句）"):
+            st.markdown("\n".join(
+                f"`{format_timestamp(seg['start'])}–{format_timestamp(seg['end'])}` {seg['text']}  "
+                for seg in segments
+            ))
 
-with col2:
+
+@st.fragment
+@timed_fragment("📝 编辑与生成片段")
+def editor_pane():
     st.subheader("📝 编辑与生成")
     
     briefing_type = st.selectbox(
         "简报类型",
-        ["会议纪要", "工作日报", "学习笔记", "新闻摘要"],
+        list(PROMPTS),
         key="briefing_type"
     )
     
@@ -613,7 +891,32 @@ with col2:
     if content != st.session_state.get("transcribed_text", ""):
         st.session_state.transcribed_text = content
     
-    custom_req = st.text_input("特殊要求", placeholder="例如：重点突出数据、使用 bullet points")
+    custom_req = st.text_input("特殊要求", placeholder="例如：重点突出数据、使用 bullet points", key="custom_req")
+    
+    fanout_types = st.multiselect(
+        "🗂️ 同时生成多种简报",
+        list(PROMPTS),
+        key="fanout_types",
+        placeholder="选择两种及以上时并发生成（忽略上方简报类型）",
+        help="各类型并发请求，内容作为共享前缀发送，可命中服务端前缀缓存；总耗时接近最慢的一份"
+    )
+    
+    # 生成前预估 token：超长输入提示将分段提炼，接近上下文上限时提前告警
+    if content.strip():
+        budget = plan_budget(briefing_type, build_system_prompt(briefing_type, custom_req), content)
+        if budget["route"] == "map_reduce":
+            st.caption(f"🧩 输入约 {budget['prompt_tokens']} tokens，超出单次处理范围，生成时将自动分段提炼")
+        elif budget["warning"]:
+            st.warning(f"⚠️ {budget['warning']}")
+        else:
+            st.caption(f"🧮 输入约 {budget['prompt_tokens']} tokens · 输出上限 {budget['max_tokens']} tokens")
+    
+    # 编辑内容或更换类型/要求后，预生成结果不再可用
+    spec = st.session_state.get("speculation")
+    if spec and (spec["content"], spec["briefing_type"], spec["custom_req"]) != (content, briefing_type, custom_req):
+        discard_speculation()
+    
+    force_regenerate = st.checkbox("🔁 强制重新生成", help="忽略缓存，重新调用模型生成")
     
     col_gen, col_clear = st.columns([3, 1])
     with col_gen:
@@ -621,54 +924,44 @@ with col2:
             if not content.strip():
                 st.error("❌ 内容不能为空")
             else:
-                with st.spinner("🤖 生成中..."):
-                    try:
-                        # v2.2.1 升级：使用统一客户端
-                        client = get_openai_client(api_key)
-                        
-                        prompts = {
-                            "会议纪要": "整理成会议纪要：1主题 2讨论 3决议 4待办",
-                            "工作日报": "整理成工作日报：1完成 2问题 3计划",
-                            "学习笔记": "整理成学习笔记：1概念 2重点 3思考",
-                            "新闻摘要": "整理成新闻摘要：1事件 2数据 3影响"
-                        }
-                        
-                        prompt = prompts[briefing_type]
-                        if custom_req:
-                            prompt += f"。要求：{custom_req}"
-                        
-                        response = client.chat.completions.create(
-                            model=CONFIG['models']['generate'],
-                            messages=[
-                                {"role": "system", "content": prompt},
-                                {"role": "user", "content": content}
-                            ],
-                            temperature=0.7,
-                            max_tokens=2000
-                        )
-                        
-                        st.session_state.generated_result = response.choices[0].message.content
-                        
-                    except Exception as e:
-                        # v2.2.1 升级：使用错误分类
-                        error_info = classify_error(e)
-                        st.error(f"{error_info['title']}：{error_info['message']}")
-                        
-                        if error_info['type'] == 'auth':
-                            if st.button("🔄 重新输入密钥", key="reauth_gen"):
-                                del st.session_state.api_key
-                                st.rerun()
+                # 生成在后台执行；重复点击会取消上一次未完成的生成
+                previous = get_job_manager().get(st.session_state.get("generate_job_id", ""))
+                if previous is not None and not previous.done:
+                    previous.cancel()
+                if len(fanout_types) >= 2:
+                    discard_speculation()
+                    job = get_job_manager().submit(
+                        "fanout", fanout_job,
+                        api_key, fanout_types, custom_req, content,
+                        history_id=st.session_state.get("history_id"), force=force_regenerate,
+                        label="、".join(fanout_types)
+                    )
+                    st.session_state.generate_job_id = job.id
+                # 开启预生成且内容与设置未改动时直接接管预生成任务
+                elif force_regenerate or not adopt_speculation(content, briefing_type, custom_req):
+                    discard_speculation()
+                    job = get_job_manager().submit(
+                        "generate", generate_job,
+                        api_key, briefing_type, custom_req, content,
+                        history_id=st.session_state.get("history_id"),
+                        stream=st.session_state.stream_mode, force=force_regenerate,
+                        label=briefing_type
+                    )
+                    st.session_state.generate_job_id = job.id
+                st.session_state.pop("generate_error", None)
     
     with col_clear:
-        if st.button("🗑️ 清空", use_container_width=True):
-            st.session_state.transcribed_text = ""
-            if "generated_result" in st.session_state:
-                del st.session_state.generated_result
-            st.rerun()
+        st.button("🗑️ 清空", use_container_width=True, on_click=clear_editor)
+    
+    st.fragment(run_every=poll_interval("generate_job_id" in st.session_state))(generate_job_panel)()
+    
+    if "generate_error" in st.session_state:
+        show_error(st.session_state.generate_error, key="reauth_gen")
     
     if "generated_result" in st.session_state:
         st.divider()
         st.success("✅ 生成完成！")
+        show_generation_stats(st.session_state.get("generation_stats", {}))
         st.markdown(st.session_state.generated_result)
         st.download_button(
             "📋 下载",
@@ -676,7 +969,119 @@ with col2:
             file_name=f"简报_{briefing_type}.txt",
             mime="text/plain"
         )
+    
+    fanout_results = st.session_state.get("fanout_results")
+    if fanout_results:
+        st.divider()
+        completed = sum(1 for result, _ in fanout_results.values() if result)
+        st.success(f"✅ 多类型生成完成：{completed}/{len(fanout_results)} 份")
+        for tab, (fanout_type, (result, stats)) in zip(st.tabs(list(fanout_results)), fanout_results.items()):
+            with tab:
+                if stats.get("error"):
+                    st.error(f"{stats['error']['error_title']}：{stats['error']['error_message']}")
+                    continue
+                show_generation_stats(stats)
+                st.markdown(result)
+                st.download_button(
+                    "📋 下载",
+                    result,
+                    file_name=f"简报_{fanout_type}.txt",
+                    mime="text/plain",
+                    key=f"download_{fanout_type}"
+                )
+
+    batch_results = st.session_state.get("batch_results")
+    if batch_results:
+        batch_type = st.session_state.get("batch_briefing_type", briefing_type)
+        st.divider()
+        completed = sum(1 for item in batch_results if item["briefing"])
+        st.success(f"📚 批量完成：{completed}/{len(batch_results)} 个文件已生成{batch_type}")
+        for i, item in enumerate(batch_results, start=1):
+            with st.expander(f"{i}. {item['name']} · {item['stage']}"):
+                if item["error"]:
+                    st.error(f"{item['error']['error_title']}：{item['error']['error_message']}")
+                st.markdown(item["briefing"] or item["transcript"] or "")
+        
+        col_zip, col_md = st.columns(2)
+        with col_zip:
+            st.download_button(
+                "📦 下载全部（zip）",
+                build_batch_zip(batch_results, batch_type),
+                file_name=f"批量简报_{batch_type}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+        with col_md:
+            st.download_button(
+                "📄 合并 Markdown",
+                build_batch_markdown(batch_results, batch_type),
+                file_name=f"批量简报_{batch_type}.md",
+                mime="text/markdown",
+                use_container_width=True
+            )
+
+
+col1, col2 = st.columns([1, 1])
+with col1:
+    voice_input_pane()
+with col2:
+    editor_pane()
+
+# ========== 侧边栏：缓存与接口统计 ==========
+with cache_stats_slot.container():
+    transcribe_stats = get_transcription_cache().stats
+    generate_stats = get_generation_cache().stats
+    # 多副本部署时显示来自共享后端（其他副本写入）的命中
+    shared = get_shared_backend().shared
+    transcribe_hits = transcribe_stats['hits'] + transcribe_stats['shared_hits'] + transcribe_stats['disk_hits']
+    transcribe_detail = f"共享 {transcribe_stats['shared_hits']} · " if shared else ""
+    st.caption(
+        f"🗄️ 转写缓存：命中 {transcribe_hits}"
+        f"（{transcribe_detail}磁盘 {transcribe_stats['disk_hits']}） · 未命中 {transcribe_stats['misses']}"
+    )
+    generate_detail = f"（共享 {generate_stats['shared_hits']}）" if shared else ""
+    st.caption(
+        f"🗄️ 生成缓存：命中 {generate_stats['hits'] + generate_stats['shared_hits']}{generate_detail}"
+        f" · 未命中 {generate_stats['misses']}"
+    )
+    speculation = get_speculation_stats()
+    if speculation.counts["started"]:
+        counts = speculation.counts
+        st.caption(
+            f"🔮 预生成：发起 {counts['started']} · 复用 {counts['reused']} · 取消 {counts['cancelled']}"
+            f" · 浪费 {counts['wasted']}（约 {speculation.wasted_tokens} tokens）"
+        )
+    saved = theme_stats['legacy'] - theme_stats['sent']
+    st.caption(
+        f"🎨 主题样式（{'静态文件' if theme_stats['static'] else '内联'}）：每次 rerun 发送 "
+        f"{format_bytes(theme_stats['sent'])}，节省 {format_bytes(saved)}（{saved / theme_stats['legacy']:.0%}）"
+    )
+    
+    metric_rows = get_metrics().summary()
+    if metric_rows:
+        with st.expander("📊 接口耗时统计"):
+            st.markdown(markdown_table(metric_rows))
+            st.caption(f"明细日志：{CONFIG['metrics']['log_path']}")
+    
+    # 本次整页耗时在页面末尾记录，表格显示的是此前各次运行
+    rows = timing_rows()
+    if rows:
+        with st.expander("⏱️ 脚本耗时"):
+            st.markdown(markdown_table(rows))
+            st.caption("整页：任一交互触发的完整 rerun；片段：栏内交互只重跑该栏")
+    
+    startup_rows = startup_timings()
+    if startup_rows:
+        with st.expander("🚀 冷启动耗时"):
+            st.markdown(markdown_table(startup_rows))
+            st.caption("进程启动后首次运行的各步骤耗时；预热在后台线程执行，不计入首次渲染")
 
 # ========== v2.2.1 升级：统一版本号引用 ==========
 st.divider()
 st.caption(f"Made with ❤️ | 分享版 v{CONFIG['version']} - iOS 自动暗黑模式")
+
+record_timing("🧾 整页", time.perf_counter() - _script_start)
+# 只有进程内第一次运行会被记录
+record_startup("首次渲染（整页脚本）", time.perf_counter() - _script_start)
+start_warm_up()
+_full_run = False
@@ -0,0 +1,143 @@
+"""冷启动计时：在全新解释器中测量核心模块导入、预热与页面首次渲染耗时，用于发现冷启动退化
+
+用法：
+    python benchmarks/cold_start.py                         # 默认各测 5 次，取中位数
+    python benchmarks/cold_start.py -n 10 --compare benchmarks/results/cold_start-上次.json --max-regression 20
+
+每项指标都在独立子进程中测量（模块缓存为空）；--max-regression 指定允许的中位数退化百分比，
+超出时以退出码 1 结束，便于在 CI 中拦截。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# 各子进程脚本最后一行输出 JSON：{指标: 毫秒}
+PROBES = {
+    "import_core": """
+import json, sys, time
+start = time.perf_counter()
+import briefing_core
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_core": elapsed * 1000, "openai_loaded": "openai" in sys.modules}))
+""",
+    "warm_up": """
+import json, time
+import briefing_core
+start = time.perf_counter()
+briefing_core.warm_up("sk-cold-start")
+print(json.dumps({"warm_up": (time.perf_counter() - start) * 1000}))
+""",
+    "first_render": """
+import json, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.session_state["api_key"] = "sk-cold-start"
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+import briefing_core
+steps = {{row["步骤"]: row["耗时 (ms)"] for row in briefing_core.startup_timings()}}
+print(json.dumps({{
+    "first_render": first * 1000,
+    "rerun": rerun * 1000,
+    "script_first_render": steps.get("首次渲染（整页脚本）"),
+    "errors": len(at.exception),
+}}))
+""",
+}
+
+
+def run_probe(name: str, work_dir: str) -> dict:
+    code = PROBES[name].format(app=os.path.join(ROOT, "app.py")) if name == "first_render" else PROBES[name]
+    env = {**os.environ, "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    # 在临时目录运行：缓存、历史库与指标日志不写入仓库
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=work_dir, env=env, capture_output=True, text=True, timeout=300
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} 失败：\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="冷启动计时（核心导入 / 预热 / 首次渲染）")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每项指标的测量次数")
+    parser.add_argument("-s", "--probes", nargs="+", choices=list(PROBES), default=list(PROBES))
+    parser.add_argument("-o", "--output", default=None, help="结果文件路径（默认 benchmarks/results/cold_start-<时间戳>.json）")
+    parser.add_argument("--compare", default=None, help="与之前的结果文件对比中位数")
+    parser.add_argument("--max-regression", type=float, default=None, help="允许的中位数退化百分比，超出时退出码为 1")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="briefing-cold-")
+    samples = {}
+    extra = {}
+    for name in args.probes:
+        for _ in range(args.repeat):
+            for key, value in run_probe(name, work_dir).items():
+                if isinstance(value, bool) or key == "errors":
+                    extra[key] = extra.get(key, 0) + int(value)
+                elif value is not None:
+                    samples.setdefault(key, []).append(value)
+        print(f"  ✓ {name}", flush=True)
+    
+    medians = {key: round(float(np.median(values)), 1) for key, values in samples.items()}
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "median_ms": medians,
+        "samples_ms": {key: [round(v, 1) for v in values] for key, values in samples.items()},
+        "flags": extra,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("cold_start-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["median_ms"]
+    
+    print()
+    print(f"{'指标':<24}{'中位数 (ms)':>14}" + (f"{'对比':>10}" if baseline else ""))
+    print("-" * 48)
+    regressions = []
+    for key, value in medians.items():
+        line = f"{key:<24}{value:>14.1f}"
+        base = (baseline or {}).get(key)
+        if base:
+            change = (value / base - 1) * 100
+            line += f"{change:>+9.1f}%"
+            if args.max_regression is not None and change > args.max_regression:
+                regressions.append(key)
+        print(line)
+    if extra:
+        print(f"\n标记：{extra}")
+    print(f"\n📄 结果已写入 {output}")
+    
+    if regressions:
+        print(f"❌ 冷启动退化超过 {args.max_regression:g}%：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
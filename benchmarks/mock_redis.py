@@ -0,0 +1,162 @@
+"""本地 Redis 兼容替身：实现共享后端用到的 RESP 命令子集，供离线压测与多副本联调
+
+支持 PING / AUTH / SELECT / GET / SET（EX / PX / NX）/ DEL / EXISTS / INCR / PEXPIRE / EXPIRE / DBSIZE / FLUSHDB。
+
+单独启动：
+    python benchmarks/mock_redis.py --port 16379
+然后设置环境变量 BRIEFING_SHARED_URL=redis://127.0.0.1:16379/0 再启动多个 Streamlit 实例
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class MockRedisState:
+    """键值数据（所有连接共享，按库号隔离）"""
+    
+    def __init__(self, password: str = None):
+        self.password = password
+        self.dbs = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+    
+    def db(self, index: int) -> dict:
+        return self.dbs.setdefault(index, {})
+    
+    @staticmethod
+    def alive(db: dict, key: bytes):
+        item = db.get(key)
+        if item is not None and item[1] is not None and time.monotonic() >= item[1]:
+            del db[key]
+            return None
+        return item
+
+
+class MockRedisHandler(socketserver.StreamRequestHandler):
+    state: MockRedisState = None
+    
+    def setup(self):
+        super().setup()
+        self.db_index = 0
+        self.authed = self.state.password is None
+    
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            self.wfile.write(self._dispatch(command))
+            self.wfile.flush()
+    
+    # ---------- RESP 协议 ----------
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # 内联命令（如 telnet 调试）
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+    
+    @staticmethod
+    def _bulk(value) -> bytes:
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+    
+    # ---------- 命令 ----------
+    def _dispatch(self, args: list) -> bytes:
+        name = args[0].upper().decode() if args else ""
+        with self.state._lock:
+            self.state.commands += 1
+            if name == "AUTH":
+                self.authed = args[-1].decode() == self.state.password
+                return b"+OK\r\n" if self.authed else b"-WRONGPASS invalid password\r\n"
+            if not self.authed:
+                return b"-NOAUTH Authentication required.\r\n"
+            handler = getattr(self, f"_cmd_{name.lower()}", None)
+            if handler is None:
+                return b"-ERR unknown command '%s'\r\n" % name.encode()
+            try:
+                return handler(self.state.db(self.db_index), args[1:])
+            except (IndexError, ValueError):
+                return b"-ERR syntax error\r\n"
+    
+    def _cmd_ping(self, db, args):
+        return b"+PONG\r\n"
+    
+    def _cmd_select(self, db, args):
+        self.db_index = int(args[0])
+        return b"+OK\r\n"
+    
+    def _cmd_get(self, db, args):
+        item = self.state.alive(db, args[0])
+        return self._bulk(None if item is None else item[0])
+    
+    def _cmd_set(self, db, args):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires = None
+        if b"EX" in options:
+            expires = time.monotonic() + float(args[2 + options.index(b"EX") + 1])
+        if b"PX" in options:
+            expires = time.monotonic() + float(args[2 + options.index(b"PX") + 1]) / 1000
+        if b"NX" in options and self.state.alive(db, key) is not None:
+            return b"$-1\r\n"
+        db[key] = (value, expires)
+        return b"+OK\r\n"
+    
+    def _cmd_del(self, db, args):
+        return b":%d\r\n" % sum(1 for key in args if db.pop(key, None) is not None)
+    
+    def _cmd_exists(self, db, args):
+        return b":%d\r\n" % sum(1 for key in args if self.state.alive(db, key) is not None)
+    
+    def _cmd_incr(self, db, args):
+        item = self.state.alive(db, args[0])
+        count = (int(item[0]) if item else 0) + 1
+        db[args[0]] = (str(count).encode(), item[1] if item else None)
+        return b":%d\r\n" % count
+    
+    def _cmd_pexpire(self, db, args):
+        item = self.state.alive(db, args[0])
+        if item is None:
+            return b":0\r\n"
+        db[args[0]] = (item[0], time.monotonic() + float(args[1]) / 1000)
+        return b":1\r\n"
+    
+    def _cmd_expire(self, db, args):
+        return self._cmd_pexpire(db, [args[0], float(args[1]) * 1000])
+    
+    def _cmd_dbsize(self, db, args):
+        return b":%d\r\n" % sum(1 for key in list(db) if self.state.alive(db, key) is not None)
+    
+    def _cmd_flushdb(self, db, args):
+        db.clear()
+        return b"+OK\r\n"
+
+
+def start_server(port: int = 0, password: str = None) -> tuple:
+    """在后台线程启动替身服务，返回 (server, state, url)；port=0 时自动分配端口"""
+    state = MockRedisState(password)
+    handler = type("BoundMockRedisHandler", (MockRedisHandler,), {"state": state})
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-redis", daemon=True).start()
+    auth = f":{password}@" if password else ""
+    return server, state, f"redis://{auth}127.0.0.1:{server.server_address[1]}/0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 Redis 兼容替身")
+    parser.add_argument("--port", type=int, default=16379)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+    server, _, url = start_server(args.port, args.password)
+    print(f"🧪 Redis 替身已启动：{url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
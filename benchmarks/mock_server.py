@@ -0,0 +1,217 @@
+"""本地模拟硅基流动（OpenAI 兼容）接口，用于离线压测，不消耗真实 API 额度
+
+支持 /audio/transcriptions 与 /chat/completions（含 SSE 流式），
+延迟、抖动、错误率、429 限流均可配置；生成接口模拟服务端前缀缓存（usage.prompt_tokens_details.cached_tokens）。
+
+单独启动：
+    python benchmarks/mock_server.py --port 18999 --latency 0.2 --jitter 0.05 --rate-limit-rate 0.05
+然后把 CONFIG['api']['base_url'] 指向 http://127.0.0.1:18999/v1
+"""
+import argparse
+import json
+import random
+import re
+import os
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULTS = {
+    "latency": 0.15,            # 每次请求的基础延迟（秒）
+    "jitter": 0.05,             # 延迟抖动（秒，均匀分布 ±jitter）
+    "latency_per_mb": 0.2,      # 转写按上传大小追加的延迟（秒/MB）
+    "error_rate": 0.0,          # 返回服务端错误的概率
+    "error_status": 503,        # 服务端错误的状态码（503 会被调度器视为网络错误并重试）
+    "rate_limit_rate": 0.0,     # 返回 429 的概率
+    "retry_after": 0.2,         # 429 响应中的 Retry-After（秒）
+    "stream_interval": 0.01,    # 流式生成每个分块的间隔（秒）
+    "completion_chars": 200,    # 生成结果的字数
+    "chunk_chars": 4            # 流式生成每个分块的字数
+}
+
+_BOUNDARY_FIELD_RE = re.compile(rb'name="response_format"\r\n\r\n([a-z_]+)')
+
+
+class MockState:
+    """模拟服务的配置与请求计数（多线程共享）"""
+    
+    def __init__(self, **options):
+        self.options = {**DEFAULTS, **options}
+        self.counts = {"transcriptions": 0, "chat": 0, "errors": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._random = random.Random(options.get("seed"))
+        self._prompts = deque(maxlen=64)    # 已完成预填充的提示，用于模拟前缀缓存
+    
+    def cached_prefix(self, prompt: str) -> int:
+        """与已缓存提示的最长公共前缀长度（按字符计，模拟 token 数）"""
+        with self._lock:
+            return max((len(os.path.commonprefix([prompt, seen])) for seen in self._prompts), default=0)
+    
+    def remember(self, prompt: str):
+        with self._lock:
+            self._prompts.append(prompt)
+    
+    def count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+    
+    def roll(self) -> float:
+        with self._lock:
+            return self._random.random()
+    
+    def delay(self, extra: float = 0.0):
+        opts = self.options
+        jitter = (self.roll() * 2 - 1) * opts["jitter"]
+        time.sleep(max(0.0, opts["latency"] + jitter + extra))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        
+        if self._inject_failure():
+            return
+        if self.path.endswith("/audio/transcriptions"):
+            self._transcription(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(json.loads(body))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+    
+    # ---------- 故障注入 ----------
+    def _inject_failure(self) -> bool:
+        opts = self.state.options
+        roll = self.state.roll()
+        if roll < opts["rate_limit_rate"]:
+            self.state.count("rate_limited")
+            self._send_json(
+                429, {"error": {"message": "rate limit exceeded", "type": "rate_limit_exceeded"}},
+                headers={"Retry-After": f"{opts['retry_after']:g}"}
+            )
+            return True
+        if roll < opts["rate_limit_rate"] + opts["error_rate"]:
+            self.state.count("errors")
+            self.state.delay()
+            self._send_json(opts["error_status"], {"error": {"message": "service unavailable", "type": "server_error"}})
+            return True
+        return False
+    
+    # ---------- 转写 ----------
+    def _transcription(self, body: bytes):
+        self.state.count("transcriptions")
+        self.state.delay(len(body) / 1e6 * self.state.options["latency_per_mb"])
+        
+        text = f"模拟转写内容，音频大小 {len(body)} 字节。"
+        match = _BOUNDARY_FIELD_RE.search(body)
+        response_format = match.group(1).decode() if match else "json"
+        if response_format == "text":
+            self._send(200, text.encode("utf-8"), "text/plain; charset=utf-8")
+        elif response_format == "verbose_json":
+            self._send_json(200, {
+                "task": "transcribe", "language": "zh", "duration": 1.0, "text": text,
+                "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": text}]
+            })
+        else:
+            self._send_json(200, {"text": text})
+    
+    # ---------- 生成 ----------
+    def _chat(self, request: dict):
+        self.state.count("chat")
+        opts = self.state.options
+        text = ("模拟简报内容。" * (opts["completion_chars"] // 7 + 1))[:opts["completion_chars"]]
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in request.get("messages", [])),
+            "completion_tokens": len(text),
+            "prompt_tokens_details": {"cached_tokens": self.state.cached_prefix(prompt)},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        
+        # 首字节前的延迟即 TTFT（预填充完成后提示进入前缀缓存）
+        self.state.delay()
+        self.state.remember(prompt)
+        if request.get("stream"):
+            self._stream_chat(text, usage)
+            return
+        self._send_json(200, {
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+    
+    def _stream_chat(self, text: str, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        step = self.state.options["chunk_chars"]
+        for i in range(0, len(text), step):
+            self._write_event({"choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]})
+            time.sleep(self.state.options["stream_interval"])
+        self._write_event({"choices": [], "usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+    
+    def _write_event(self, payload: dict):
+        payload = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "mock", **payload}
+        self._write_chunk(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+    
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+    
+    # ---------- 响应 ----------
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", headers)
+    
+    def _send(self, status: int, data: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(port: int = 0, **options) -> tuple:
+    """在后台线程启动模拟服务，返回 (server, state, base_url)；port=0 时自动分配端口"""
+    state = MockState(**options)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-siliconflow", daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """模拟服务参数（压测脚本复用）"""
+    for key, value in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（固定后故障注入可复现）")
+
+
+def server_options(args) -> dict:
+    return {key: getattr(args, key) for key in (*DEFAULTS, "seed")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟硅基流动接口")
+    parser.add_argument("--port", type=int, default=18999)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server, _, base_url = start_server(args.port, **server_options(args))
+    print(f"🧪 模拟接口已启动：{base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
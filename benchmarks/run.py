@@ -0,0 +1,264 @@
+"""离线压测：在本地模拟接口上运行各场景，输出吞吐量与延迟分位数
+
+用法：
+    python benchmarks/run.py                              # 全部场景，默认参数
+    python benchmarks/run.py -s single_transcribe generate_cached -n 50
+    python benchmarks/run.py --latency 0.3 --rate-limit-rate 0.05 --compare benchmarks/results/上次.json
+    python benchmarks/run.py --shared-backend               # 缓存 / 限流 / 任务状态走本地 Redis 替身
+
+结果写入 benchmarks/results/<时间戳>.json，可用 --compare 与之前的结果对比。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import briefing_core as core
+from mock_server import start_server, add_server_arguments, server_options
+import mock_redis
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+# ========== 测试数据 ==========
+def make_wav(seconds: float, seed: int, sample_rate: int = 16000, channels: int = 1) -> bytes:
+    """生成带语音状能量起伏与停顿的 WAV（每个 seed 内容不同，避免命中转写缓存）"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    envelope = (np.sin(2 * np.pi * 0.3 * t) > -0.6).astype(np.float32)
+    signal = np.sin(2 * np.pi * 220 * t) * 6000 * envelope + rng.normal(0, 200, n)
+    samples = np.repeat(signal[:, None], channels, axis=1).astype("<i2")
+    return core.write_wav(samples, sample_rate, 2)
+
+
+def make_transcript(seed: int, chars: int = 3000) -> str:
+    base = f"第{seed}次会议讨论了项目进度、预算调整与下季度计划。"
+    return (base * (chars // len(base) + 1))[:chars]
+
+
+# ========== 场景 ==========
+def timed(func, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run_parallel(task, count: int, concurrency: int) -> tuple:
+    """并发执行 task(i)，返回 ([(耗时, 结果)], 总墙钟时间)"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(lambda i: timed(task, i), range(count)))
+    return samples, time.perf_counter() - start
+
+
+def is_ok(result) -> bool:
+    if isinstance(result, dict):
+        return result.get("success", result.get("stage") == "完成")
+    return bool(result)
+
+
+def scenario_single_transcribe(api_key: str, args) -> tuple:
+    """单文件转写（10 秒 48 kHz 双声道，含预处理）"""
+    audios = [make_wav(10, seed, 48000, 2) for seed in range(args.iterations)]
+    return run_parallel(lambda i: core.transcribe_audio(audios[i], api_key), args.iterations, 1)
+
+
+def scenario_long_audio(api_key: str, args) -> tuple:
+    """长音频分段并行转写（5 分钟）"""
+    count = max(1, args.iterations // 10)
+    audios = [make_wav(300, 1000 + seed) for seed in range(count)]
+    return run_parallel(lambda i: core.transcribe_audio(audios[i], api_key), count, 1)
+
+
+def scenario_batch_files(api_key: str, args) -> tuple:
+    """批量模式：一个批量任务同时处理多个文件（转写 + 生成）"""
+    count = max(1, args.iterations // 10)
+    batches = [
+        [(f"b{b}_{i}.wav", make_wav(8, 2000 + b * 100 + i), "audio/wav") for i in range(args.batch_size)]
+        for b in range(count)
+    ]
+    
+    def run_batch(b: int):
+        job = core.Job("batch")
+        items = core.batch_job(job, batches[b], api_key, "会议纪要", "")
+        return all(is_ok(item) for item in items)
+    return run_parallel(run_batch, count, 1)
+
+
+def scenario_generate_uncached(api_key: str, args) -> tuple:
+    """生成（非流式，每次内容不同，不命中缓存）"""
+    return run_parallel(
+        lambda i: core.run_generation(api_key, "会议纪要", "", make_transcript(3000 + i), stream=False)[0],
+        args.iterations, 1
+    )
+
+
+def scenario_generate_stream(api_key: str, args) -> tuple:
+    """生成（流式，每次内容不同）"""
+    return run_parallel(
+        lambda i: core.run_generation(api_key, "会议纪要", "", make_transcript(4000 + i), stream=True)[0],
+        args.iterations, 1
+    )
+
+
+def scenario_generate_cached(api_key: str, args) -> tuple:
+    """生成（重复内容，首次之后命中缓存）"""
+    content = make_transcript(5000)
+    core.run_generation(api_key, "会议纪要", "", content, stream=False)
+    return run_parallel(
+        lambda i: core.run_generation(api_key, "会议纪要", "", content, stream=False)[0],
+        args.iterations, 1
+    )
+
+
+def scenario_fanout(api_key: str, args) -> tuple:
+    """多类型并发生成（四种简报共用一份内容作为前缀）"""
+    types = list(core.PROMPTS)
+    return run_parallel(
+        lambda i: all(r for r, _ in core.fanout_generation(api_key, types, "", make_transcript(7000 + i)).values()),
+        args.iterations, 1
+    )
+
+
+def scenario_concurrent_sessions(api_key: str, args) -> tuple:
+    """多会话并发：每个会话独立完成一次转写 + 生成"""
+    count = args.sessions * max(1, args.iterations // 10)
+    audios = [make_wav(8, 6000 + seed) for seed in range(count)]
+    
+    def session(i: int):
+        item = core.new_batch_item(f"s{i}.wav")
+        return core.brief_audio(item, audios[i], api_key, "会议纪要", mime_type="audio/wav")
+    return run_parallel(session, count, args.sessions)
+
+
+SCENARIOS = {
+    "single_transcribe": scenario_single_transcribe,
+    "long_audio": scenario_long_audio,
+    "batch_files": scenario_batch_files,
+    "generate_uncached": scenario_generate_uncached,
+    "generate_stream": scenario_generate_stream,
+    "generate_cached": scenario_generate_cached,
+    "fanout": scenario_fanout,
+    "concurrent_sessions": scenario_concurrent_sessions,
+}
+
+
+# ========== 统计与报告 ==========
+def summarize(samples: list, wall: float) -> dict:
+    latency = [elapsed for elapsed, _ in samples]
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "errors": sum(1 for _, result in samples if not is_ok(result)),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(samples) / wall, 2) if wall else None,
+        "mean_s": round(float(np.mean(latency)), 4),
+        "p50_s": round(float(p50), 4),
+        "p95_s": round(float(p95), 4),
+        "p99_s": round(float(p99), 4),
+        "max_s": round(max(latency), 4),
+    }
+
+
+def print_table(results: dict, baseline: dict = None):
+    header = f"{'场景':<22}{'次数':>6}{'失败':>6}{'吞吐/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}"
+    if baseline:
+        header += f"{'p50 对比':>12}"
+    print(header)
+    print("-" * 83)
+    for name, row in results.items():
+        line = (
+            f"{name:<22}{row['count']:>6}{row['errors']:>6}{row['throughput_per_s']:>10}"
+            f"{row['p50_s']:>9.3f}{row['p95_s']:>9.3f}{row['p99_s']:>9.3f}"
+        )
+        base = (baseline or {}).get(name)
+        if base and base.get("p50_s"):
+            line += f"{(row['p50_s'] / base['p50_s'] - 1) * 100:>+11.1f}%"
+        print(line)
+
+
+def configure_core(base_url: str, work_dir: str):
+    """压测前调整配置：指向模拟接口，缓存、指标日志与历史记录写入临时目录（不污染用户的 .cache）"""
+    core.CONFIG['api']['base_url'] = base_url
+    core.CONFIG['cache']['transcribe']['disk_path'] = os.path.join(work_dir, "transcripts.sqlite3")
+    core.CONFIG['metrics']['log_path'] = os.path.join(work_dir, "api_metrics.jsonl")
+    core.CONFIG['history']['path'] = os.path.join(work_dir, "history.sqlite3")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线压测（本地模拟硅基流动接口）")
+    parser.add_argument("-s", "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="每个场景的请求次数（长音频/批量按 1/10）")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent_sessions 的并发会话数")
+    parser.add_argument("--batch-size", type=int, default=6, help="batch_files 每批文件数")
+    parser.add_argument("-o", "--output", default=None, help="结果文件路径（默认 benchmarks/results/<时间戳>.json）")
+    parser.add_argument("--compare", default=None, help="与之前的结果文件对比 p50")
+    parser.add_argument("--shared-backend", action="store_true", help="启动本地 Redis 替身作为共享后端（多副本部署的开销）")
+    add_server_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    server, state, base_url = start_server(**server_options(args))
+    work_dir = tempfile.mkdtemp(prefix="briefing-bench-")
+    configure_core(base_url, work_dir)
+    redis_server = redis_state = None
+    if args.shared_backend:
+        # 须在首次取用缓存 / 调度器之前设置
+        redis_server, redis_state, core.CONFIG['shared']['url'] = mock_redis.start_server()
+    api_key = "sk-benchmark"
+    
+    print(f"🧪 模拟接口 {base_url}，场景：{', '.join(args.scenarios)}")
+    results = {}
+    for name in args.scenarios:
+        samples, wall = SCENARIOS[name](api_key, args)
+        results[name] = summarize(samples, wall)
+        print(f"  ✓ {name}：{results[name]['count']} 次，{wall:.2f}s", flush=True)
+    server.shutdown()
+    if redis_server is not None:
+        redis_server.shutdown()
+    
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": core.VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": server_options(args),
+        "config": {
+            key: core.CONFIG[key]
+            for key in ("api", "scheduler", "long_audio", "batch", "map_reduce", "fanout", "shared")
+        },
+        "mock_counts": state.counts,
+        "shared_backend_commands": redis_state.commands if redis_state else None,
+        "scenarios": results,
+        "api_metrics": core.get_metrics().summary(),
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["scenarios"]
+    print()
+    print_table(results, baseline)
+    print(f"\n📄 结果已写入 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2786 @@
+"""AI语音简报助手：转写与生成流水线（不依赖 Streamlit，可供 Web 界面、命令行与其他服务复用）"""
+import os
+import io
+import re
+import wave
+import json
+import time
+import random
+import functools
+import hashlib
+import sqlite3
+import unicodedata
+import threading
+import difflib
+import asyncio
+import queue
+import importlib.util
+import socket
+import urllib.parse
+import contextvars
+import uuid
+import zipfile
+import shutil
+import secrets
+import tempfile
+import weakref
+import contextlib
+from collections import OrderedDict, deque, defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    # openai（连同 httpx2）导入约需 0.7 秒，运行时在 _openai() 中按需导入
+    import httpx2
+    from openai import AsyncOpenAI
+
+# ========== v2.2.1 升级：版本号与配置集中管理 ==========
+VERSION = "2.2.1"
+
+CONFIG = {
+    "version": VERSION,
+    "api": {
+        "base_url": "https://api.siliconflow.cn/v1",
+        "timeout": 60,
+        "max_connections": 32,              # 连接池总连接数上限
+        "max_keepalive_connections": 16,    # 保持空闲的长连接数
+        "keepalive_expiry": 60,             # 空闲长连接保留时间（秒）
+        "http2": True                       # 需安装 h2，未安装时自动回退 HTTP/1.1
+    },
+    "models": {
+        "transcribe": "FunAudioLLM/SenseVoiceSmall",
+        "generate": "deepseek-ai/DeepSeek-V3"
+    },
+    "transcription": {
+        "response_format": "verbose_json"   # verbose_json 附带分句时间戳；接口不支持时可改为 json / text
+    },
+    "metrics": {
+        "log_path": ".cache/api_metrics.jsonl",    # 每次 API 调用一行 JSON，设为 None 关闭
+        "window": 2000                             # 侧边栏分位数统计使用的最近记录数
+    },
+    "scheduler": {
+        "max_retries": 4,               # network / quota 错误的最大重试次数
+        "backoff_base": 0.5,            # 指数退避基数（秒）
+        "backoff_max": 20,              # 单次退避上限（秒）
+        "retry_after_max": 60,          # Retry-After 头的最长遵循时长（秒）
+        "rate_per_second": 5,           # 每个 API 密钥的请求速率
+        "burst": 10,                    # 令牌桶容量（允许的突发请求数）
+        "breaker_threshold": 5,         # 连续网络错误次数达到后熔断
+        "breaker_cooldown": 30          # 熔断持续时间（秒），之后放行一次探测请求
+    },
+    "generate": {
+        "temperature": 0.7,
+        "max_tokens": 2000,
+        "stream": True,             # 默认开启流式生成
+        "speculative": False        # 预生成：转写完成即按当前简报类型在后台生成（默认关闭，会产生额外调用）
+    },
+    "budget": {
+        "context_tokens": 64000,        # 生成模型上下文窗口（DeepSeek-V3）
+        "reserve_tokens": 1024,         # 预留给消息格式开销与估算误差
+        "tokenizer_path": None,         # 本地 tokenizer.json（需安装 tokenizers）；None 时使用离线估算
+        "output": {                     # 输出上限 = 输入 token × ratio，限制在 [min, max] 之间
+            "会议纪要": {"ratio": 0.3, "min": 600, "max": 2500},
+            "工作日报": {"ratio": 0.2, "min": 400, "max": 1200},
+            "学习笔记": {"ratio": 0.35, "min": 600, "max": 3000},
+            "新闻摘要": {"ratio": 0.15, "min": 300, "max": 1000},
+            "default": {"ratio": 0.3, "min": 500, "max": 2000}
+        }
+    },
+    "fanout": {
+        "prefix_warmup": True       # 多类型生成时先等首个请求开始输出（前缀已缓存）再并发其余请求
+    },
+    "batch": {
+        "concurrency": 3            # 批量模式同时处理的文件数（转写 + 生成）
+    },
+    "jobs": {
+        "max_workers": 8,           # 后台任务线程数（转写/生成任务脱离脚本线程执行）
+        "poll_interval": 0.3,       # 页面轮询任务状态的间隔（秒），同时决定流式渲染粒度
+        "retention": 3600           # 已结束任务保留时长（秒）
+    },
+    "cache": {
+        "transcribe": {
+            "max_entries": 256,                     # 内存层最多条目数
+            "max_bytes": 32 * 1024 * 1024,          # 内存层最大字节数（按转写文本计）
+            "disk_path": ".cache/transcripts.sqlite3",  # 磁盘层路径，设为 None 关闭
+            "disk_max_entries": 10000,
+            "shared_ttl": 7 * 24 * 3600             # 共享后端中的保留时长（秒）
+        },
+        "generate": {
+            "max_entries": 128,
+            "max_bytes": 8 * 1024 * 1024,
+            "ttl": 3600                             # 生成结果有效期（秒）
+        }
+    },
+    "shared": {
+        "url": os.environ.get("BRIEFING_SHARED_URL"),  # 多副本部署时指向 Redis 兼容服务，如 redis://:密码@host:6379/0
+        "prefix": "briefing:",          # 键前缀，多个应用共用同一实例时区分
+        "timeout": 2,                   # 连接与读写超时（秒）
+        "pool_size": 8,                 # 连接池大小
+        "job_sync_interval": 0.5        # 本副本任务状态同步到共享后端的间隔（秒）
+    },
+    "upload": {
+        "spool_threshold": 16 * 1024 * 1024,        # 超过此大小的上传先落盘暂存，转写时按块读取
+        "session_memory_limit": 64 * 1024 * 1024,   # 每个会话在内存中保留的音频字节上限，超出后新上传一律落盘
+        "spool_dir": ".cache/uploads",              # 暂存根目录，每个进程在其下创建仅本用户可读写的私有子目录
+        "chunk_size": 1024 * 1024,                  # 落盘、计算摘要与流式上传的分块大小
+        "retention": 24 * 3600                      # 进程内首次使用暂存目录时清理超过此时长的遗留文件（秒）
+    },
+    "history": {
+        "path": ".cache/history.sqlite3",   # 历史记录库路径，设为 None 关闭
+        "search_limit": 20                  # 每次检索返回的条数
+    },
+    "preprocess": {
+        "enabled": True,                # WAV/PCM 上传前预处理（下混单声道 + 重采样 + 裁剪静音）
+        "sample_rate": 16000,           # 目标采样率（SenseVoiceSmall 实际使用 16 kHz）
+        "trim_silence": True,           # 裁剪首尾静音
+        "silence_threshold_db": -45,    # 低于此能量（dBFS）视为静音
+        "keep_silence_ms": 200,         # 裁剪后首尾保留的静音时长
+        "frame_ms": 30
+    },
+    "long_audio": {
+        "enabled": True,                # WAV/PCM 长音频自动分段并行转写
+        "chunk_seconds": 60,            # 每段目标时长
+        "overlap_seconds": 2,           # 相邻分段重叠时长
+        "silence_search_seconds": 8,    # 在目标切点前多长范围内寻找静音
+        "frame_ms": 30,                 # 静音检测的能量帧长
+        "max_workers": 4,               # 并发转写线程数
+        "stitch_window": 48,            # 拼接去重时比较的首尾词数
+        "stitch_min_match": 3           # 判定为重叠所需的最少连续相同词数
+    },
+    "live": {
+        "window_seconds": 8,            # 边录边转：每个窗口的时长
+        "overlap_seconds": 1,           # 相邻窗口的重叠时长（拼接时去重）
+        "min_tail_seconds": 0.5         # 停止录音时剩余不足此时长（不含重叠）的尾段不再转写
+    },
+    "map_reduce": {
+        "threshold_tokens": 12000,      # 估算 token 超过此值时启用分段提炼
+        "segment_tokens": 6000,         # 每段 token 预算
+        "map_max_tokens": 800,          # 每段提炼的输出上限
+        "max_workers": 4,               # 并发提炼线程数
+        "max_levels": 3                 # 提炼结果仍过长时最多再提炼的层数
+    },
+    "theme": {
+        "light": {
+            "bg_primary": "#ffffff",
+            "bg_secondary": "#f0f2f6",
+            "bg_card": "#ffffff",
+            "text_primary": "#1f1f1f",
+            "text_secondary": "#666666",
+            "border_color": "#e0e0e0",
+            "accent_color": "#ff4b4b",
+            "accent_hover": "#ff3333",
+            "shadow": "rgba(0, 0, 0, 0.1)",
+            "input_bg": "#ffffff",
+            "input_text": "#1f1f1f",
+            "button_text": "#ffffff"
+        },
+        "dark": {
+            "bg_primary": "#000000",
+            "bg_secondary": "#1c1c1e",
+            "bg_card": "#2c2c2e",
+            "text_primary": "#ffffff",
+            "text_secondary": "#8e8e93",
+            "border_color": "#38383a",
+            "accent_color": "#0a84ff",
+            "accent_hover": "#409cff",
+            "shadow": "rgba(0, 0, 0, 0.5)",
+            "input_bg": "#1c1c1e",
+            "input_text": "#ffffff",
+            "button_text": "#ffffff"
+        }
+    }
+}
+
+# ========== API 调用指标：JSONL 日志 + 分位数统计 ==========
+# 当前协程正在执行的调用指标（每个后台任务独立一份上下文）
+_current_metric = contextvars.ContextVar("current_metric", default=None)
+
+
+class MetricsRecorder:
+    """记录每次 API 调用的指标，追加写入 JSONL 并保留最近记录用于分位数统计"""
+    
+    FIELDS = (
+        "ts", "operation", "model", "status", "cache_hit", "upload_bytes", "queue_wait",
+        "backoff_wait", "attempts", "ttfb", "total", "prompt_tokens", "completion_tokens", "cached_tokens"
+    )
+    
+    def __init__(self, log_path: str = None, window: int = 2000):
+        self.records = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._log = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            self._log = open(log_path, "a", encoding="utf-8", buffering=1)
+    
+    def record(self, metric: dict):
+        entry = {key: metric.get(key) for key in self.FIELDS}
+        entry["ts"] = entry["ts"] or time.time()
+        with self._lock:
+            self.records.append(entry)
+            if self._log is not None:
+                self._log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    
+    def summary(self) -> list:
+        """按 (操作, 模型) 汇总调用次数、缓存命中数与总耗时 p50/p95/p99"""
+        groups = defaultdict(list)
+        with self._lock:
+            for entry in self.records:
+                groups[(entry["operation"], entry["model"])].append(entry)
+        
+        rows = []
+        for (operation, model), entries in sorted(groups.items()):
+            api_latency = [e["total"] for e in entries if not e["cache_hit"] and e["total"] is not None]
+            row = {
+                "操作": operation,
+                "模型": model.split("/")[-1],
+                "调用": len(entries),
+                "缓存命中": sum(1 for e in entries if e["cache_hit"]),
+                "失败": sum(1 for e in entries if e["status"] not in ("ok", None)),
+                "前缀缓存 tokens": sum(e.get("cached_tokens") or 0 for e in entries),
+            }
+            if api_latency:
+                p50, p95, p99 = np.percentile(api_latency, [50, 95, 99])
+                row.update({"p50 (s)": round(p50, 2), "p95 (s)": round(p95, 2), "p99 (s)": round(p99, 2)})
+            rows.append(row)
+        return rows
+
+
+@functools.lru_cache(maxsize=None)
+def get_metrics() -> MetricsRecorder:
+    """获取进程级指标记录器"""
+    return MetricsRecorder(CONFIG['metrics']['log_path'], CONFIG['metrics']['window'])
+
+
+def new_metric(operation: str, model: str, **fields) -> dict:
+    return {"operation": operation, "model": model, "cache_hit": False, **fields}
+
+
+def annotate_metric(**fields):
+    """在正在执行的 API 调用中补充指标字段（如上传大小、token 用量）"""
+    metric = _current_metric.get()
+    if metric is not None:
+        metric.update(fields)
+
+
+def annotate_usage(usage):
+    if usage is not None:
+        # 命中服务端前缀缓存的提示 token：OpenAI 格式在 prompt_tokens_details，DeepSeek 格式为 prompt_cache_hit_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or getattr(usage, "prompt_cache_hit_tokens", None)
+        annotate_metric(
+            prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+            cached_tokens=cached
+        )
+
+
+async def _record_ttfb(response):
+    """httpx 响应钩子：收到响应头时记录首字节时间"""
+    metric = _current_metric.get()
+    if metric is not None and "attempt_start" in metric:
+        metric["ttfb"] = time.perf_counter() - metric["attempt_start"]
+
+# ========== 异步客户端：后台事件循环 + 共享连接池 ==========
+@functools.lru_cache(maxsize=None)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取进程级后台事件循环（守护线程运行），所有会话共享"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="briefing-event-loop", daemon=True).start()
+    return loop
+
+
+def submit_async(coro):
+    """将协程提交到后台事件循环，返回 concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run_async(coro):
+    """在后台事件循环上执行协程并同步等待结果"""
+    return submit_async(coro).result()
+
+
+def iter_async(agen):
+    """在后台事件循环上消费异步生成器，同步逐项返回"""
+    items = queue.Queue()
+    done = object()
+    
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+            raise
+        finally:
+            items.put(done)
+    
+    future = submit_async(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # 调用方提前停止迭代时取消后台任务
+        future.cancel()
+
+
+def run_bounded(coros: list, limit: int, progress=None) -> list:
+    """以并发上限 limit 执行一组协程，按原顺序返回结果；任一失败时取消其余"""
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def guarded(coro):
+        try:
+            async with semaphore:
+                return await coro
+        finally:
+            # 排队时被取消的协程未曾启动，显式关闭以免泄漏
+            coro.close()
+    
+    futures = [submit_async(guarded(coro)) for coro in coros]
+    index = {future: i for i, future in enumerate(futures)}
+    results = [None] * len(futures)
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[index[future]] = future.result()
+            if progress:
+                progress(done, len(futures))
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_pool() -> "httpx2.AsyncClient":
+    """获取进程级共享 HTTP 连接池（keep-alive，可选 HTTP/2），各 API 密钥复用同一组连接"""
+    openai = _openai()
+    import httpx2
+    cfg = CONFIG['api']
+    return openai.DefaultAsyncHttpxClient(
+        http2=cfg['http2'] and importlib.util.find_spec("h2") is not None,
+        limits=httpx2.Limits(
+            max_connections=cfg['max_connections'],
+            max_keepalive_connections=cfg['max_keepalive_connections'],
+            keepalive_expiry=cfg['keepalive_expiry']
+        ),
+        timeout=cfg['timeout'],
+        event_hooks={"response": [_record_ttfb]}
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_client(api_key: str) -> "AsyncOpenAI":
+    """获取异步 OpenAI 客户端（按密钥缓存，底层共享连接池）"""
+    return _openai().AsyncOpenAI(
+        api_key=api_key,
+        base_url=CONFIG['api']['base_url'],
+        timeout=CONFIG['api']['timeout'],
+        max_retries=0,  # 重试统一由 RequestScheduler 负责
+        http_client=get_http_pool()
+    )
+
+
+# ========== 冷启动：延迟导入 + 预热 ==========
+_startup_timings = {}
+_startup_lock = threading.Lock()
+
+
+def record_startup(step: str, seconds: float):
+    """记录进程冷启动各步骤耗时（只保留首次，即真正的冷启动开销）"""
+    with _startup_lock:
+        _startup_timings.setdefault(step, seconds * 1000)
+
+
+def startup_timings() -> list:
+    with _startup_lock:
+        return [{"步骤": step, "耗时 (ms)": round(ms, 1)} for step, ms in _startup_timings.items()]
+
+
+@functools.lru_cache(maxsize=None)
+def _openai():
+    """延迟导入 openai（模块导入耗时的大头），首次创建连接池或客户端时才加载"""
+    start = time.perf_counter()
+    import openai
+    record_startup("导入 openai", time.perf_counter() - start)
+    return openai
+
+
+def warm_up(api_key: str = None, connect: bool = False) -> list:
+    """预热：导入 openai，创建事件循环、连接池、缓存与历史库，可选按密钥创建客户端并预先建立连接
+    
+    供 Web 界面在后台线程调用（不阻塞首屏），或由命令行 / 其他服务在处理请求前调用；返回冷启动计时。
+    """
+    steps = [
+        ("预热：事件循环", get_event_loop),
+        ("预热：HTTP 连接池", get_http_pool),
+        ("预热：缓存", lambda: (get_transcription_cache(), get_generation_cache(), get_shared_backend())),
+        ("预热：历史库", get_history_store),
+    ]
+    if api_key:
+        steps.append(("预热：API 客户端", lambda: get_async_client(api_key)))
+    if connect:
+        # 任意响应都会在连接池中留下已完成 TLS 握手的长连接，首个真实请求可直接复用
+        steps.append(("预热：建立连接", lambda: run_async(get_http_pool().head(CONFIG['api']['base_url'], timeout=5))))
+    
+    for step, func in steps:
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            # 预热失败不影响正常使用，首次请求时会按原路径重试
+            continue
+        record_startup(step, time.perf_counter() - start)
+    return startup_timings()
+
+# ========== v2.2.1 升级：错误分类处理 ==========
+def classify_error(error: Exception) -> dict:
+    """分类错误类型"""
+    error_str = str(error).lower()
+    
+    # 认证错误
+    if any(kw in error_str for kw in ['401', 'unauthorized', 'invalid api key', 'authentication']):
+        return {
+            "type": "auth",
+            "title": "🔐 认证失败",
+            "message": "API 密钥无效或已过期，请检查密钥是否正确",
+            "action": "更换密钥"
+        }
+    
+    # 网络错误
+    elif any(kw in error_str for kw in ['connection', 'timeout', 'network', 'dns', '404', '503']):
+        return {
+            "type": "network",
+            "title": "📡 网络错误",
+            "message": "无法连接到服务器，请检查网络连接或稍后重试",
+            "action": "重试"
+        }
+    
+    # 格式/参数错误
+    elif any(kw in error_str for kw in ['400', 'bad request', 'invalid', 'format']):
+        return {
+            "type": "format",
+            "title": "⚠️ 请求格式错误",
+            "message": "音频格式不支持或文件损坏，请尝试其他文件",
+            "action": "更换文件"
+        }
+    
+    # 配额/限制错误
+    elif any(kw in error_str for kw in ['429', 'quota', 'rate limit', 'insufficient']):
+        return {
+            "type": "quota",
+            "title": "💰 额度不足",
+            "message": "API 调用额度已用完或请求过于频繁",
+            "action": "检查额度"
+        }
+    
+    # 未知错误
+    else:
+        return {
+            "type": "unknown",
+            "title": "❌ 未知错误",
+            "message": f"发生未知错误：{str(error)}",
+            "action": "重试"
+        }
+
+# ========== 共享后端：进程内默认 / Redis 兼容服务（多副本共享缓存、任务状态与限流） ==========
+class SharedBackendError(ConnectionError):
+    """共享后端不可用；调用方降级为进程内行为，不影响请求本身"""
+
+
+class MemoryBackend:
+    """进程内键值存储（默认后端，单副本部署），支持 TTL 与计数器"""
+    
+    shared = False
+    
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def _alive(self, key: str):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and time.monotonic() >= item[1]:
+            del self._data[key]
+            return None
+        return item
+    
+    def get(self, key: str):
+        with self._lock:
+            item = self._alive(key)
+            return None if item is None else item[0]
+    
+    def set(self, key: str, value: bytes, ttl: float = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def incr(self, key: str, ttl: float = None) -> int:
+        """计数器加一并返回新值；ttl 为计数器整体有效期"""
+        with self._lock:
+            item = self._alive(key)
+            count = (int(item[0]) if item else 0) + 1
+            self._data[key] = (str(count).encode(), time.monotonic() + ttl if ttl else None)
+            return count
+    
+    def ping(self) -> bool:
+        return True
+
+
+class RedisBackend:
+    """Redis 兼容服务的最小 RESP2 客户端：连接池 + 管道化命令，网络错误统一抛 SharedBackendError"""
+    
+    shared = True
+    
+    def __init__(self, url: str, prefix: str = "", timeout: float = 2.0, pool_size: int = 8):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = urllib.parse.unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+    
+    # ---------- RESP 协议 ----------
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+    
+    @classmethod
+    def _read_reply(cls, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise SharedBackendError("connection closed by shared backend")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return RuntimeError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise SharedBackendError("connection closed by shared backend")
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [cls._read_reply(reader) for _ in range(length)]
+        raise SharedBackendError(f"unexpected reply from shared backend: {line[:32]!r}")
+    
+    # ---------- 连接池 ----------
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in self._roundtrip(conn, setup):
+                if isinstance(reply, Exception):
+                    sock.close()
+                    raise SharedBackendError(f"shared backend rejected connection: {reply}")
+        return conn
+    
+    def _roundtrip(self, conn, commands) -> list:
+        sock, reader = conn
+        sock.sendall(b"".join(self._encode(command) for command in commands))
+        return [self._read_reply(reader) for _ in commands]
+    
+    def execute(self, *commands) -> list:
+        """管道化发送多条命令，按顺序返回各自的回复"""
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            replies = self._roundtrip(conn, commands)
+        except (OSError, SharedBackendError) as e:
+            if conn is not None:
+                conn[0].close()
+            raise SharedBackendError(f"shared backend unavailable: {e}") from e
+        finally:
+            self._slots.release()
+        self._idle.put(conn)
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise SharedBackendError(f"shared backend error: {reply}")
+        return replies
+    
+    # ---------- 键值接口（与 MemoryBackend 一致） ----------
+    def get(self, key: str):
+        return self.execute(("GET", self.prefix + key))[0]
+    
+    def set(self, key: str, value: bytes, ttl: float = None):
+        command = ("SET", self.prefix + key, value)
+        if ttl:
+            command += ("PX", max(1, int(ttl * 1000)))
+        self.execute(command)
+    
+    def delete(self, key: str):
+        self.execute(("DEL", self.prefix + key))
+    
+    def incr(self, key: str, ttl: float = None) -> int:
+        commands = [("INCR", self.prefix + key)]
+        if ttl:
+            commands.append(("PEXPIRE", self.prefix + key, max(1, int(ttl * 1000))))
+        return self.execute(*commands)[0]
+    
+    def ping(self) -> bool:
+        return self.execute(("PING",))[0] == b"PONG"
+
+
+def shared_get_json(backend, key: str):
+    """从共享后端读取 JSON 值；后端不可用时视为未命中"""
+    try:
+        data = backend.get(key)
+    except SharedBackendError:
+        return None
+    return None if data is None else _json_loads(data)
+
+
+def shared_set_json(backend, key: str, value, ttl: float = None):
+    """写入 JSON 值；后端不可用时忽略（下次由其他副本或本副本重新计算）"""
+    try:
+        backend.set(key, json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"), ttl)
+    except SharedBackendError:
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_backend():
+    """获取进程级共享后端：配置了 url 时连接 Redis 兼容服务，否则使用进程内存储"""
+    cfg = CONFIG['shared']
+    if not cfg['url']:
+        return MemoryBackend()
+    return RedisBackend(cfg['url'], cfg['prefix'], cfg['timeout'], cfg['pool_size'])
+
+# ========== 请求调度：限流 + 重试退避 + 熔断 ==========
+class CircuitOpenError(Exception):
+    """熔断期间快速失败（消息含 network，classify_error 归为网络错误）"""
+
+
+def parse_retry_after(error: Exception):
+    """从错误响应头解析 Retry-After（秒），无法解析时返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，允许 burst 个突发请求"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self) -> float:
+        """取得一个令牌，返回排队等待时长"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+    
+    async def pause(self, seconds: float):
+        """收到 429 后清空令牌，使同一密钥的后续请求至少等待 seconds 秒"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class SharedRateLimiter:
+    """多副本共享的限流：固定窗口计数（窗口 burst / rate 秒内最多 burst 个请求），429 暂停期同样共享
+    
+    共享后端不可用时退回本副本的令牌桶。
+    """
+    
+    def __init__(self, backend, api_key: str, rate: float, burst: int):
+        self.backend = backend
+        self.key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self.limit = burst
+        self.window = burst / rate
+        self.fallback = TokenBucket(rate, burst)
+    
+    async def _try_acquire(self) -> float:
+        """尝试取得名额，返回 0 表示成功，否则返回建议等待时长"""
+        now = time.time()
+        paused_until = await asyncio.to_thread(self.backend.get, f"pause:{self.key}")
+        if paused_until and float(paused_until) > now:
+            return float(paused_until) - now
+        slot = int(now // self.window)
+        count = await asyncio.to_thread(self.backend.incr, f"rate:{self.key}:{slot}", self.window * 2)
+        if count <= self.limit:
+            return 0.0
+        # 下一窗口开始后再试，加少量抖动避免各副本同时涌入
+        return (slot + 1) * self.window - now + random.uniform(0, self.window * 0.1)
+    
+    async def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            try:
+                delay = await self._try_acquire()
+            except SharedBackendError:
+                return waited + await self.fallback.acquire()
+            if delay <= 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+    
+    async def pause(self, seconds: float):
+        await self.fallback.pause(seconds)
+        # 同步 RESP 往返放到线程中执行，后端缓慢或不可达时不阻塞事件循环上的其他请求
+        try:
+            await asyncio.to_thread(
+                self.backend.set, f"pause:{self.key}", str(time.time() + seconds).encode(), seconds
+            )
+        except SharedBackendError:
+            pass
+
+
+class CircuitBreaker:
+    """熔断器：连续网络错误达到阈值后在冷却期内快速失败，冷却后放行一次探测"""
+    
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+    
+    def before_call(self) -> bool:
+        """放行前检查，返回本次调用是否为半开状态下的探测"""
+        state = self.state
+        if state == "open" or (state == "half_open" and self.probing):
+            raise CircuitOpenError("network unavailable: circuit open, upstream is failing")
+        if state == "half_open":
+            self.probing = True
+            return True
+        return False
+    
+    def release_probe(self):
+        """探测调用结束：未得出成败（被取消、非网络类异常）时交还探测名额，否则已由 record_* 复位"""
+        self.probing = False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class RequestScheduler:
+    """SiliconFlow 请求调度：每密钥令牌桶限流、network/quota 错误指数退避重试、上游熔断
+    
+    共享后端为多副本时，限流计数与 429 暂停期在各副本间共享；熔断状态仍按副本各自判断。
+    """
+    
+    def __init__(self, cfg: dict, backend=None):
+        self.cfg = cfg
+        self.backend = backend
+        self.buckets = {}
+        self.breaker = CircuitBreaker(cfg['breaker_threshold'], cfg['breaker_cooldown'])
+    
+    def _bucket(self, api_key: str):
+        if api_key not in self.buckets:
+            if self.backend is not None and self.backend.shared:
+                self.buckets[api_key] = SharedRateLimiter(
+                    self.backend, api_key, self.cfg['rate_per_second'], self.cfg['burst']
+                )
+            else:
+                self.buckets[api_key] = TokenBucket(self.cfg['rate_per_second'], self.cfg['burst'])
+        return self.buckets[api_key]
+    
+    async def _retry_delay(self, api_key: str, error: Exception, attempt: int):
+        """记录失败并返回重试前的等待时长；不应重试时返回 None"""
+        error_type = classify_error(error)["type"]
+        if error_type == "network":
+            self.breaker.record_failure()
+        else:
+            # 非网络错误说明上游可达
+            self.breaker.record_success()
+        
+        if error_type not in ("network", "quota") or attempt >= self.cfg['max_retries']:
+            return None
+        
+        retry_after = parse_retry_after(error)
+        if retry_after is not None:
+            delay = min(retry_after, self.cfg['retry_after_max'])
+            if error_type == "quota":
+                await self._bucket(api_key).pause(delay)
+            return delay
+        
+        # 指数退避 + 全抖动，避免并发请求同时重试
+        return random.uniform(0, min(self.cfg['backoff_max'], self.cfg['backoff_base'] * 2 ** attempt))
+    
+    async def _begin_attempt(self, api_key: str, metric: dict):
+        """限流排队，并累计排队时长（熔断检查由调用方在此之前完成）"""
+        metric["queue_wait"] = metric.get("queue_wait", 0.0) + await self._bucket(api_key).acquire()
+        metric["attempts"] = metric.get("attempts", 0) + 1
+        metric["attempt_start"] = time.perf_counter()
+    
+    async def _backoff(self, delay: float, metric: dict):
+        metric["backoff_wait"] = metric.get("backoff_wait", 0.0) + delay
+        await asyncio.sleep(delay)
+    
+    async def run(self, api_key: str, call, metric: dict = None):
+        """执行 call()（返回协程的可调用对象），按策略重试；等待时长写入 metric"""
+        metric = {} if metric is None else metric
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                await self._begin_attempt(api_key, metric)
+                result = await call()
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                delay = await self._retry_delay(api_key, e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # 探测被取消（如 run_bounded 取消同组请求）时也须交还名额，否则熔断器永远停在半开
+                if probe:
+                    self.breaker.release_probe()
+            await self._backoff(delay, metric)
+            attempt += 1
+    
+    async def stream(self, api_key: str, call, metric: dict = None):
+        """执行 call()（返回异步生成器），仅在尚未产出内容时重试"""
+        metric = {} if metric is None else metric
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            started = False
+            try:
+                await self._begin_attempt(api_key, metric)
+                async for item in call():
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                        # 探测已由 record_success 复位；流可能持续很久，结束时不再触碰熔断器
+                        probe = False
+                    yield item
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = await self._retry_delay(api_key, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                if probe:
+                    self.breaker.release_probe()
+            await self._backoff(delay, metric)
+            attempt += 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler() -> RequestScheduler:
+    """获取进程级请求调度器（所有会话共享限流与熔断状态）"""
+    return RequestScheduler(CONFIG['scheduler'], get_shared_backend())
+
+
+async def _tracked_run(scheduler: RequestScheduler, metrics: MetricsRecorder, api_key: str, metric: dict, call):
+    _current_metric.set(metric)
+    start = time.perf_counter()
+    try:
+        result = await scheduler.run(api_key, call, metric)
+        metric["status"] = "ok"
+        return result
+    except Exception as e:
+        metric["status"] = classify_error(e)["type"]
+        raise
+    finally:
+        metric["total"] = time.perf_counter() - start
+        metrics.record(metric)
+
+
+async def _tracked_stream(scheduler: RequestScheduler, metrics: MetricsRecorder, api_key: str, metric: dict, call):
+    _current_metric.set(metric)
+    start = time.perf_counter()
+    try:
+        async for item in scheduler.stream(api_key, call, metric):
+            yield item
+        metric["status"] = "ok"
+    except Exception as e:
+        metric["status"] = classify_error(e)["type"]
+        raise
+    finally:
+        metric["total"] = time.perf_counter() - start
+        metrics.record(metric)
+
+
+def scheduled(api_key: str, metric: dict, func, *args):
+    """返回经调度器执行 func(*args) 的协程，并记录调用指标"""
+    return _tracked_run(get_scheduler(), get_metrics(), api_key, metric, functools.partial(func, *args))
+
+
+def scheduled_stream(api_key: str, metric: dict, func, *args):
+    """返回经调度器执行流式 func(*args) 的异步生成器，并记录调用指标"""
+    return _tracked_stream(get_scheduler(), get_metrics(), api_key, metric, functools.partial(func, *args))
+
+# ========== 转写缓存：内存 LRU + 共享后端 + SQLite 磁盘层 ==========
+class LRUCache:
+    """线程安全的内存 LRU 缓存，按条目数与字节数淘汰，可选 TTL 过期"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, size, expires_at = item
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._data[key]
+                self.total_bytes -= size
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value, size: int):
+        with self._lock:
+            if key in self._data:
+                self.total_bytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, size, expires_at)
+            self.total_bytes += size
+            while len(self._data) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.total_bytes -= evicted[1]
+    
+    def __len__(self):
+        return len(self._data)
+
+
+class TranscriptionCache:
+    """转写结果缓存：以音频内容哈希 + 模型为键，内存层未命中时依次查询共享后端与磁盘层"""
+    
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        disk_path: str = None,
+        disk_max_entries: int = 10000,
+        backend=None,
+        shared_ttl: float = None
+    ):
+        self.memory = LRUCache(max_entries, max_bytes)
+        self.stats = {"hits": 0, "shared_hits": 0, "disk_hits": 0, "misses": 0}
+        # 仅多副本后端需要作为独立一层；进程内后端与内存层重复
+        self.backend = backend if backend is not None and backend.shared else None
+        self.shared_ttl = shared_ttl
+        self.disk_max_entries = disk_max_entries
+        self._db = None
+        self._db_lock = threading.Lock()
+        
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL, segments TEXT)"
+            )
+            # 旧版本建的表没有 segments 列
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(transcripts)")}
+            if "segments" not in columns:
+                self._db.execute("ALTER TABLE transcripts ADD COLUMN segments TEXT")
+            self._db.commit()
+    
+    @staticmethod
+    def make_key(audio, model: str) -> str:
+        """计算缓存键：模型 ID + 音频内容的 SHA-256（暂存文件按块读取）"""
+        digest = hashlib.sha256(model.encode("utf-8"))
+        digest.update(b"\0")
+        for block in audio.blocks() if isinstance(audio, SpooledAudio) else (audio,):
+            digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _size(transcript: dict) -> int:
+        # 按文本估算：每个分句另计时间戳开销
+        return len(transcript["text"].encode("utf-8")) * 2 + 32 * len(transcript["segments"])
+    
+    def get(self, key: str):
+        """返回 {"text", "segments"}，未命中时返回 None"""
+        transcript = self.memory.get(key)
+        if transcript is not None:
+            self.stats["hits"] += 1
+            return transcript
+        
+        if self.backend is not None:
+            transcript = shared_get_json(self.backend, f"tr:{key}")
+            if transcript is not None:
+                self.stats["shared_hits"] += 1
+                self.memory.set(key, transcript, self._size(transcript))
+                return transcript
+        
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT text, segments FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.stats["disk_hits"] += 1
+                transcript = {"text": row[0], "segments": _json_loads(row[1]) if row[1] else []}
+                self.memory.set(key, transcript, self._size(transcript))
+                if self.backend is not None:
+                    shared_set_json(self.backend, f"tr:{key}", transcript, self.shared_ttl)
+                return transcript
+        
+        self.stats["misses"] += 1
+        return None
+    
+    def set(self, key: str, transcript: dict):
+        self.memory.set(key, transcript, self._size(transcript))
+        if self.backend is not None:
+            shared_set_json(self.backend, f"tr:{key}", transcript, self.shared_ttl)
+        
+        if self._db is not None:
+            segments = json.dumps(transcript["segments"], ensure_ascii=False) if transcript["segments"] else None
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transcripts (key, text, created, segments) VALUES (?, ?, ?, ?)",
+                    (key, transcript["text"], time.time(), segments)
+                )
+                # 磁盘层按写入时间淘汰最旧条目
+                self._db.execute(
+                    "DELETE FROM transcripts WHERE key IN ("
+                    "SELECT key FROM transcripts ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,)
+                )
+                self._db.commit()
+
+
+@functools.lru_cache(maxsize=None)
+def get_transcription_cache() -> TranscriptionCache:
+    """获取进程级转写缓存（所有会话共享）"""
+    cfg = CONFIG['cache']['transcribe']
+    return TranscriptionCache(
+        max_entries=cfg['max_entries'],
+        max_bytes=cfg['max_bytes'],
+        disk_path=cfg['disk_path'],
+        disk_max_entries=cfg['disk_max_entries'],
+        backend=get_shared_backend(),
+        shared_ttl=cfg['shared_ttl']
+    )
+
+# ========== 生成结果缓存：TTL + LRU + 共享后端 ==========
+class GenerationCache:
+    """简报生成结果缓存：以规范化的 (系统提示, 内容, 模型, 温度) 哈希为键，多副本时共享"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, backend=None):
+        self.memory = LRUCache(max_entries, max_bytes, ttl=ttl)
+        self.ttl = ttl
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+        self.backend = backend if backend is not None and backend.shared else None
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化文本：统一全半角与换行，去除行尾空白"""
+        text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n")
+        return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+    
+    @classmethod
+    def make_key(cls, system_prompt: str, content: str, model: str, temperature: float, max_tokens: int) -> str:
+        payload = json.dumps(
+            [cls.normalize(system_prompt), cls.normalize(content), model, round(float(temperature), 4), max_tokens],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str):
+        text = self.memory.get(key)
+        if text is not None:
+            self.stats["hits"] += 1
+            return text
+        
+        if self.backend is not None:
+            text = shared_get_json(self.backend, f"gen:{key}")
+            if text is not None:
+                self.stats["shared_hits"] += 1
+                self.memory.set(key, text, len(text.encode("utf-8")))
+                return text
+        
+        self.stats["misses"] += 1
+        return None
+    
+    def set(self, key: str, text: str):
+        self.memory.set(key, text, len(text.encode("utf-8")))
+        if self.backend is not None:
+            shared_set_json(self.backend, f"gen:{key}", text, self.ttl)
+
+
+@functools.lru_cache(maxsize=None)
+def get_generation_cache() -> GenerationCache:
+    """获取进程级生成结果缓存（所有会话共享）"""
+    cfg = CONFIG['cache']['generate']
+    return GenerationCache(
+        max_entries=cfg['max_entries'],
+        max_bytes=cfg['max_bytes'],
+        ttl=cfg['ttl'],
+        backend=get_shared_backend()
+    )
+
+# ========== 历史记录：SQLite + FTS5 全文检索 ==========
+_BIGRAM_RUN = re.compile(r"[^\W_]+")
+
+
+def _bigram_terms(*texts) -> str:
+    """把文本切成重叠的二字词（每段连续字母数字末尾再补单字），供 unicode61 分词的短词索引使用
+    
+    每个字都是某个词的首字：二字词按整词匹配，单字按前缀匹配。
+    """
+    terms = []
+    for text in texts:
+        for run in _BIGRAM_RUN.findall(text or ""):
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+            terms.append(run[-1])
+    return " ".join(terms)
+
+
+class HistoryStore:
+    """持久化转写与简报：按音频哈希去重，FTS5 trigram 索引支持中文子串检索
+    
+    trigram 无法索引不足 3 字的检索词，这些词走二字词索引（history_bigram）；
+    SQLite 未编译 FTS5 时、以及含标点的短词退化为 LIKE 扫描。
+    """
+    
+    COLUMNS = ("id", "created", "audio_hash", "source", "transcript", "briefing_type", "custom_req", "result")
+    
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # 二字词索引的触发器调用该函数，连接上须先注册
+        self._db.create_function("bigram_terms", 2, _bigram_terms, deterministic=True)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                audio_hash TEXT,
+                source TEXT,
+                transcript TEXT NOT NULL,
+                briefing_type TEXT,
+                custom_req TEXT,
+                result TEXT
+            );
+            CREATE INDEX IF NOT EXISTS history_created ON history (created);
+            CREATE INDEX IF NOT EXISTS history_audio_hash ON history (audio_hash);
+        """)
+        self.fts = self._create_fts()
+        self._db.commit()
+    
+    def _create_fts(self) -> bool:
+        # 外部内容表 + 触发器：正文只存一份，索引随 history 自动同步
+        # 二字词索引为无内容表（只存词、不存位置），删除时按旧文本重新切词
+        backfill = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'history_bigram'"
+        ).fetchone() is None
+        try:
+            self._db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    transcript, result, content='history', content_rowid='id', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, transcript, result) VALUES (new.id, new.transcript, new.result);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, transcript, result)
+                    VALUES ('delete', old.id, old.transcript, old.result);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_au AFTER UPDATE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, transcript, result)
+                    VALUES ('delete', old.id, old.transcript, old.result);
+                    INSERT INTO history_fts (rowid, transcript, result) VALUES (new.id, new.transcript, new.result);
+                END;
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_bigram USING fts5(
+                    terms, content='', detail='none', tokenize='unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_bigram_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_bigram (rowid, terms) VALUES (new.id, bigram_terms(new.transcript, new.result));
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_bigram_ad AFTER DELETE ON history BEGIN
+                    INSERT INTO history_bigram (history_bigram, rowid, terms)
+                    VALUES ('delete', old.id, bigram_terms(old.transcript, old.result));
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_bigram_au AFTER UPDATE ON history BEGIN
+                    INSERT INTO history_bigram (history_bigram, rowid, terms)
+                    VALUES ('delete', old.id, bigram_terms(old.transcript, old.result));
+                    INSERT INTO history_bigram (rowid, terms) VALUES (new.id, bigram_terms(new.transcript, new.result));
+                END;
+            """)
+            if backfill:
+                # 旧版本创建的库补建二字词索引
+                self._db.execute(
+                    "INSERT INTO history_bigram (rowid, terms) SELECT id, bigram_terms(transcript, result) FROM history"
+                )
+            return True
+        except sqlite3.OperationalError:
+            return False
+    
+    def _rows(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(self.COLUMNS + ("snippet",), row)) for row in rows]
+    
+    def add(self, transcript: str, audio_hash: str = None, source: str = None,
+            briefing_type: str = None, custom_req: str = None, result: str = None) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO history (created, audio_hash, source, transcript, briefing_type, custom_req, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), audio_hash, source, transcript, briefing_type, custom_req, result)
+            )
+            self._db.commit()
+            return cursor.lastrowid
+    
+    def attach_result(self, entry_id: int, transcript: str, briefing_type: str, custom_req: str, result: str,
+                      cached: bool = False) -> int:
+        """把简报写回对应的转写记录；记录已有简报或文本已被编辑时另存一条，返回记录 ID
+        
+        记录中已是同一份简报（如重复点击生成）时不再写入；命中缓存的简报优先复用已保存的相同记录。
+        """
+        entry = self.get(entry_id) if entry_id else None
+        fields = {"transcript": transcript, "briefing_type": briefing_type, "custom_req": custom_req, "result": result}
+        if entry is not None and all(entry[key] == value for key, value in fields.items()):
+            return entry_id
+        if cached:
+            existing = self.find_briefing(transcript, briefing_type, custom_req, result)
+            if existing is not None:
+                return existing
+        if entry is None or entry["result"] is not None or entry["transcript"] != transcript:
+            return self.add(
+                transcript,
+                audio_hash=entry["audio_hash"] if entry else None,
+                source=entry["source"] if entry else None,
+                briefing_type=briefing_type, custom_req=custom_req, result=result
+            )
+        with self._lock:
+            self._db.execute(
+                "UPDATE history SET briefing_type = ?, custom_req = ?, result = ? WHERE id = ?",
+                (briefing_type, custom_req, result, entry_id)
+            )
+            self._db.commit()
+        return entry_id
+    
+    def get(self, entry_id: int):
+        rows = self._rows("SELECT *, NULL FROM history WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+    
+    def find_briefing(self, transcript: str, briefing_type: str, custom_req: str, result: str):
+        """最近一条内容、类型、要求与简报完全相同的记录 ID；用 trigram 索引按简报中段定位候选行，避免全表比较"""
+        middle = len(result) // 2
+        probe = result[max(0, middle - 24):middle + 24]
+        if not self.fts or len(probe) < 3:
+            return None
+        rows = self._rows(
+            "SELECT h.*, NULL FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+            "WHERE history_fts MATCH ? AND h.result = ? AND h.transcript = ? "
+            "AND h.briefing_type IS ? AND h.custom_req IS ? ORDER BY history_fts.rowid DESC LIMIT 1",
+            ('result : "' + probe.replace('"', '""') + '"', result, transcript, briefing_type, custom_req)
+        )
+        return rows[0]["id"] if rows else None
+    
+    def find_by_audio(self, audio_hash: str):
+        """同一音频最近一次的记录"""
+        rows = self._rows(
+            "SELECT *, NULL FROM history WHERE audio_hash = ? ORDER BY created DESC LIMIT 1", (audio_hash,)
+        )
+        return rows[0] if rows else None
+    
+    def recent(self, limit: int) -> list:
+        return self._rows("SELECT *, NULL FROM history ORDER BY created DESC LIMIT ?", (limit,))
+    
+    def search(self, query: str, limit: int) -> list:
+        """全文检索转写与简报，多个词之间为“且”，最新的在前；结果附带命中片段
+        
+        不短于 3 字的词走 trigram 索引，更短的词走二字词索引，只有含标点的短词在命中行上再用 LIKE 过滤。
+        """
+        terms = query.split()
+        if not terms:
+            return self.recent(limit)
+        
+        long_terms = [term for term in terms if len(term) >= 3] if self.fts else []
+        pair_terms = [
+            term for term in terms if term not in long_terms and _BIGRAM_RUN.fullmatch(term)
+        ] if self.fts else []
+        short_terms = [term for term in terms if term not in long_terms and term not in pair_terms]
+        # 二字词整词匹配；单字是以它开头的二字词（或段末单字）的前缀
+        pair_match = " ".join('"' + term + '"' + ("*" if len(term) == 1 else "") for term in pair_terms)
+        like_sql = " AND ".join(
+            "(h.transcript LIKE ? ESCAPE '\\' OR h.result LIKE ? ESCAPE '\\')" for _ in short_terms
+        ) or "1"
+        like_params = []
+        for term in short_terms:
+            pattern = "%" + re.sub(r"([%_\\])", r"\\\1", term) + "%"
+            like_params += [pattern, pattern]
+        
+        if long_terms:
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            pair_sql = "h.id IN (SELECT rowid FROM history_bigram WHERE history_bigram MATCH ?)" if pair_terms else "1"
+            # 按 rowid（即写入时间）倒序，取满条数即可结束，不必为全部命中行计算相关度
+            return self._rows(
+                "SELECT h.*, snippet(history_fts, -1, '**', '**', '…', 16) FROM history_fts "
+                "JOIN history h ON h.id = history_fts.rowid "
+                f"WHERE history_fts MATCH ? AND {pair_sql} AND {like_sql} ORDER BY history_fts.rowid DESC LIMIT ?",
+                (match, *([pair_match] if pair_terms else []), *like_params, limit)
+            )
+        
+        if pair_terms:
+            # 二字词索引不存正文，命中片段按首个词截取
+            rows = self._rows(
+                "SELECT h.*, NULL FROM history_bigram JOIN history h ON h.id = history_bigram.rowid "
+                f"WHERE history_bigram MATCH ? AND {like_sql} ORDER BY history_bigram.rowid DESC LIMIT ?",
+                (pair_match, *like_params, limit)
+            )
+        else:
+            rows = self._rows(
+                f"SELECT h.*, NULL FROM history h WHERE {like_sql} ORDER BY h.created DESC LIMIT ?",
+                (*like_params, limit)
+            )
+        for row in rows:
+            row["snippet"] = _like_snippet(row, (pair_terms or terms)[0])
+        return rows
+    
+    def delete(self, entry_id: int):
+        with self._lock:
+            self._db.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+            self._db.commit()
+
+
+def _like_snippet(row: dict, term: str, width: int = 16) -> str:
+    for text in (row["transcript"], row["result"] or ""):
+        pos = text.find(term)
+        if pos >= 0:
+            start = max(0, pos - width)
+            return ("…" if start else "") + text[start:pos] + f"**{term}**" + text[pos + len(term):pos + len(term) + width] + "…"
+    return ""
+
+
+@functools.lru_cache(maxsize=None)
+def get_history_store():
+    """获取进程级历史记录库；未配置路径时返回 None"""
+    path = CONFIG['history']['path']
+    return HistoryStore(path) if path else None
+
+
+def audio_hash(audio) -> str:
+    if isinstance(audio, SpooledAudio):
+        return audio.sha256
+    return hashlib.sha256(audio).hexdigest()
+
+
+def record_history(**fields):
+    """写入历史记录（失败不影响主流程），返回记录 ID"""
+    store = get_history_store()
+    if store is None:
+        return None
+    try:
+        return store.add(**fields)
+    except sqlite3.Error:
+        return None
+
+
+def record_briefing(entry_id, transcript: str, briefing_type: str, custom_req: str, result: str, cached: bool = False):
+    """简报生成后写回历史记录，返回记录 ID；相同简报已保存过时返回已有记录"""
+    store = get_history_store()
+    if store is None:
+        return None
+    try:
+        return store.attach_result(entry_id, transcript, briefing_type, custom_req, result, cached=cached)
+    except sqlite3.Error:
+        return None
+
+# ========== 大文件上传：落盘暂存，按块读取 ==========
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _read_blocks(f):
+    return iter(functools.partial(f.read, CONFIG['upload']['chunk_size']), b"")
+
+
+@functools.lru_cache(maxsize=None)
+def _prepare_spool_dir(root: str) -> str:
+    """在暂存根目录下创建本进程的私有子目录（0700），并清理超过保留期的遗留暂存（进程异常退出时未删除）"""
+    os.makedirs(root, exist_ok=True)
+    cutoff = time.time() - CONFIG['upload']['retention']
+    for entry in os.scandir(root):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass
+    return tempfile.mkdtemp(prefix="spool-", dir=root)
+
+
+def spool_directory(directory: str = None) -> str:
+    """本进程的私有暂存目录：参数 > CONFIG['upload']['spool_dir'] > 系统临时目录，下建私有子目录"""
+    root = directory or CONFIG['upload']['spool_dir'] or os.path.join(tempfile.gettempdir(), "briefing-uploads")
+    path = _prepare_spool_dir(os.path.abspath(root))
+    # 子目录可能被其他进程按保留期清理，写入前确保存在
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+class SpooledAudio:
+    """落盘暂存的音频：内存中只保留路径、大小与 SHA-256，转写时按块读取或内存映射
+    
+    spool() 创建的暂存文件在转写任务结束、调用 remove() 或对象被回收时删除；from_path() 引用已有文件，不会删除。
+    """
+    
+    def __init__(self, path: str, size: int, sha256: str, owned: bool = False):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.owned = owned
+        if owned:
+            self._finalizer = weakref.finalize(self, _remove_quietly, path)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    @classmethod
+    def spool(cls, fileobj, directory: str = None, suffix: str = "") -> "SpooledAudio":
+        """把文件对象分块写入暂存目录并同时计算摘要，只复制一次，不整体读入内存"""
+        path = os.path.join(spool_directory(directory), secrets.token_hex(16) + suffix)
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+        try:
+            with open(path, "wb") as f:
+                for block in _read_blocks(fileobj):
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+        except BaseException:
+            _remove_quietly(path)
+            raise
+        return cls(path, size, digest.hexdigest(), owned=True)
+    
+    @classmethod
+    def from_path(cls, path: str) -> "SpooledAudio":
+        """引用磁盘上已有的音频（命令行使用），只按块计算摘要"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in _read_blocks(f):
+                digest.update(block)
+        return cls(path, os.path.getsize(path), digest.hexdigest())
+    
+    def blocks(self):
+        """按块读取文件内容"""
+        with open(self.path, "rb") as f:
+            yield from _read_blocks(f)
+    
+    def open(self):
+        return open(self.path, "rb")
+    
+    def remove(self):
+        """立即删除暂存文件（不再回放或转写时）"""
+        if self.owned:
+            self._finalizer()
+
+
+def should_spool(size: int, held: int = 0) -> bool:
+    """上传是否落盘：超过大小阈值，或会话已在内存中保留的音频加上它会超出上限"""
+    cfg = CONFIG['upload']
+    return size >= cfg['spool_threshold'] or held + size > cfg['session_memory_limit']
+
+
+def map_wav(path: str):
+    """PCM WAV 文件内存映射为样本数组[帧, 声道]（按需分页读入，不占用进程堆内存）；非 PCM WAV 返回 None"""
+    try:
+        with open(path, "rb") as f:
+            with wave.open(f) as wf:
+                params = wf.getparams()
+            # wave 不公开数据块偏移，逐块查找 data
+            f.seek(12)
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                size = int.from_bytes(header[4:], "little")
+                if header[:4] == b"data":
+                    offset = f.tell()
+                    break
+                f.seek(size + size % 2, 1)
+    except (wave.Error, EOFError, OSError):
+        return None
+    
+    dtype = {1: np.uint8, 2: "<i2", 4: "<i4"}.get(params.sampwidth)
+    frame_size = params.sampwidth * params.nchannels
+    frames = min(params.nframes, (os.path.getsize(path) - offset) // frame_size)
+    if dtype is None or frames <= 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, params.nchannels)), params
+
+
+# ========== 长音频分段：WAV/PCM 静音切分 ==========
+def read_wav(audio_bytes: bytes):
+    """解析 PCM WAV，返回 (样本数组[帧, 声道], 参数)；非 PCM WAV 返回 None"""
+    if audio_bytes[:4] != b"RIFF" or audio_bytes[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as wf:
+            params = wf.getparams()
+            raw = wf.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        return None
+    
+    dtype = {1: np.uint8, 2: "<i2", 4: "<i4"}.get(params.sampwidth)
+    if dtype is None:
+        return None
+    samples = np.frombuffer(raw, dtype=dtype)
+    samples = samples[:len(samples) - len(samples) % params.nchannels]
+    return samples.reshape(-1, params.nchannels), params
+
+
+def write_wav(samples: np.ndarray, sample_rate: int, sample_width: int) -> bytes:
+    """将样本数组编码为 WAV 字节"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(samples.shape[1])
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(np.ascontiguousarray(samples).tobytes())
+    return buf.getvalue()
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    """下混为单声道 float32，幅度统一到 16-bit 量程"""
+    mono = samples.mean(axis=1, dtype=np.float32)
+    if samples.dtype == np.uint8:
+        mono = (mono - 128.0) * 256.0
+    elif samples.dtype.itemsize == 4:
+        mono /= 65536.0
+    return mono
+
+
+def frame_rms(mono: np.ndarray, sample_rate: int, frame_ms: int) -> tuple:
+    """逐帧 RMS 能量（向量化），返回 (能量数组, 帧长)"""
+    win = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(mono) // win
+    frames = mono[:n_frames * win].reshape(n_frames, win)
+    return np.sqrt(np.mean(frames * frames, axis=1)), win
+
+
+def frame_energy(samples: np.ndarray, sample_rate: int, frame_ms: int, block_frames: int = 512) -> tuple:
+    """逐块下混后计算逐帧 RMS（结果同 frame_rms），峰值内存与音频总长无关，样本可为内存映射"""
+    win = max(1, int(sample_rate * frame_ms / 1000))
+    step = win * block_frames
+    energy = [
+        frame_rms(to_mono(samples[i:i + step]), sample_rate, frame_ms)[0]
+        for i in range(0, len(samples), step)
+    ]
+    return (np.concatenate(energy) if energy else np.zeros(0, dtype=np.float32)), win
+
+
+def find_chunk_bounds(samples: np.ndarray, sample_rate: int, cfg: dict) -> list:
+    """计算分段边界 [(起, 止)]：在目标切点前的静音最低处切分，并向后重叠"""
+    total = len(samples)
+    chunk = int(cfg['chunk_seconds'] * sample_rate)
+    overlap = int(cfg['overlap_seconds'] * sample_rate)
+    search = int(cfg['silence_search_seconds'] * sample_rate)
+    if total <= chunk + overlap:
+        return [(0, total)]
+    
+    # 逐帧能量用于定位静音
+    energy, win = frame_energy(samples, sample_rate, cfg['frame_ms'])
+    
+    bounds = []
+    start = 0
+    while total - start > chunk + overlap:
+        target = start + chunk
+        lo = max(start + chunk // 2, target - search) // win
+        hi = max(lo + 1, target // win)
+        cut = (lo + int(np.argmin(energy[lo:hi]))) * win + win // 2
+        bounds.append((start, min(total, cut + overlap)))
+        start = cut
+    bounds.append((start, total))
+    return bounds
+
+
+def split_wav_chunks(audio_bytes: bytes) -> list:
+    """将长 WAV 切分为带重叠的分段 [(起始秒, 结束秒, 编码器)]；非 WAV 或无需切分时返回 None
+    
+    每个分段是零拷贝的样本视图，调用编码器时才生成 WAV 字节，
+    因此峰值内存只与并发数有关，与分段总数无关。
+    """
+    cfg = CONFIG['long_audio']
+    if not cfg['enabled']:
+        return None
+    parsed = read_wav(audio_bytes)
+    if parsed is None:
+        return None
+    samples, params = parsed
+    bounds = find_chunk_bounds(samples, params.framerate, cfg)
+    if len(bounds) < 2:
+        return None
+    rate = params.framerate
+    return [
+        (a / rate, b / rate, functools.partial(write_wav, samples[a:b], rate, params.sampwidth))
+        for a, b in bounds
+    ]
+
+
+def encode_wav_chunk(samples: np.ndarray, sample_rate: int, sample_width: int) -> bytes:
+    """编码暂存 WAV 的一个分段；开启预处理时下混单声道并降采样（分段边界已按静音选取，不再裁剪）"""
+    cfg = CONFIG['preprocess']
+    if not cfg['enabled']:
+        return write_wav(samples, sample_rate, sample_width)
+    mono = to_mono(samples)
+    if sample_rate > cfg['sample_rate']:
+        mono = resample(mono, sample_rate, cfg['sample_rate'])
+        sample_rate = cfg['sample_rate']
+    pcm = np.clip(np.rint(mono), -32768, 32767).astype("<i2")
+    return write_wav(pcm.reshape(-1, 1), sample_rate, 2)
+
+
+def split_spooled_wav(audio: SpooledAudio) -> list:
+    """暂存的 PCM WAV 内存映射后切分为 [(起始秒, 结束秒, 编码器)]；非 PCM WAV 或预处理与分段均关闭时返回 None
+    
+    不整体解码：静音检测逐块进行，各分段在编码时才读入并下混、降采样，
+    文件多大都只占用与并发数相当的内存。
+    """
+    cfg = CONFIG['long_audio']
+    if not (cfg['enabled'] or CONFIG['preprocess']['enabled']):
+        return None
+    mapped = map_wav(audio.path)
+    if mapped is None:
+        return None
+    samples, params = mapped
+    rate = params.framerate
+    bounds = find_chunk_bounds(samples, rate, cfg) if cfg['enabled'] else [(0, len(samples))]
+    return [
+        (a / rate, b / rate, functools.partial(encode_wav_chunk, samples[a:b], rate, params.sampwidth))
+        for a, b in bounds
+    ]
+
+
+# ========== 音频预处理：单声道 16 kHz + 裁剪静音 ==========
+def trim_silence(mono: np.ndarray, sample_rate: int, cfg: dict) -> np.ndarray:
+    """裁剪首尾静音，首尾各保留 keep_silence_ms"""
+    energy, win = frame_rms(mono, sample_rate, cfg['frame_ms'])
+    threshold = 32768.0 * 10 ** (cfg['silence_threshold_db'] / 20)
+    voiced = np.flatnonzero(energy > threshold)
+    if len(voiced) == 0:
+        # 全部低于阈值时保留原样，交由模型判断
+        return mono
+    pad = int(sample_rate * cfg['keep_silence_ms'] / 1000)
+    start = max(0, voiced[0] * win - pad)
+    end = min(len(mono), (voiced[-1] + 1) * win + pad)
+    return mono[start:end]
+
+
+def resample(mono: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """降采样：滑动平均低通抑制混叠，整数倍直接抽取，否则线性插值"""
+    ratio = src_rate / dst_rate
+    width = int(round(ratio))
+    # 空音频（如录音停止时的空尾段）或短于滤波器宽度时无法滤波插值，原样返回
+    if len(mono) < max(width, 2):
+        return mono
+    if width > 1:
+        mono = np.convolve(mono, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    if ratio == width:
+        return mono[::width]
+    positions = np.arange(int(len(mono) / ratio)) * ratio
+    return np.interp(positions, np.arange(len(mono)), mono).astype(np.float32)
+
+
+def preprocess_audio(audio_bytes: bytes) -> tuple:
+    """WAV 上传前预处理，返回 (音频字节, {"before", "after"})；非 WAV 或已关闭时原样返回且信息为 None"""
+    cfg = CONFIG['preprocess']
+    if not cfg['enabled']:
+        return audio_bytes, None
+    parsed = read_wav(audio_bytes)
+    if parsed is None:
+        return audio_bytes, None
+    samples, params = parsed
+    
+    mono = to_mono(samples)
+    if cfg['trim_silence']:
+        mono = trim_silence(mono, params.framerate, cfg)
+    rate = params.framerate
+    if rate > cfg['sample_rate']:
+        mono = resample(mono, rate, cfg['sample_rate'])
+        rate = cfg['sample_rate']
+    
+    pcm = np.clip(np.rint(mono), -32768, 32767).astype("<i2")
+    processed = write_wav(pcm.reshape(-1, 1), rate, 2)
+    
+    # 处理后没有变小（如原本就是 16 kHz 单声道且无静音）则沿用原始音频
+    if len(processed) >= len(audio_bytes):
+        processed = audio_bytes
+    return processed, {"before": len(audio_bytes), "after": len(processed)}
+
+
+def format_bytes(size: int) -> str:
+    """字节数转为易读格式"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+# ========== 长音频拼接：重叠去重 ==========
+# 英文/数字按整词、中文按单字切分；标点不参与重叠比较
+_STITCH_TOKEN_RE = re.compile(r"[A-Za-z0-9']+|[^\W_]")
+_STITCH_STRIP = " \t\n，。、；：！？,.;:!?"
+
+def stitch_transcripts(texts: list, window: int, min_match: int) -> str:
+    """按顺序拼接分段转写结果，去除重叠区域中重复出现的词"""
+    result = ""
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if not result:
+            result = text
+            continue
+        
+        tail = [m.group().lower() for m in _STITCH_TOKEN_RE.finditer(result[-window * 16:])][-window:]
+        head = list(_STITCH_TOKEN_RE.finditer(text))[:window]
+        match = difflib.SequenceMatcher(
+            None, tail, [m.group().lower() for m in head], autojunk=False
+        ).find_longest_match(0, len(tail), 0, len(head))
+        if match.size >= min_match:
+            text = text[head[match.b + match.size - 1].end():].lstrip(_STITCH_STRIP)
+            if not text:
+                continue
+        
+        result = _join_text(result, text)
+    return result
+
+
+def _join_text(result: str, text: str) -> str:
+    # 中文直接相连，英文/数字之间补空格
+    sep = " " if result and result[-1].isascii() and result[-1].isalnum() and text[0].isascii() else ""
+    return result + sep + text
+
+
+def stitch_segments(chunk_results: list, bounds: list, tolerance: float = 0.25) -> tuple:
+    """按分句时间戳拼接分段结果，重叠区不再比较文本
+    
+    chunk_results 为各分段的 {"text", "segments"}，bounds 为对应的 (起始秒, 结束秒)。
+    被分段末尾截断的分句交给下一段；已覆盖时间范围内的分句视为重复丢弃。
+    返回 (文本, 绝对时间戳分句列表)。
+    """
+    text, segments = "", []
+    covered = float("-inf")
+    for i, (result, (start, end)) in enumerate(zip(chunk_results, bounds)):
+        is_last = i + 1 == len(bounds)
+        for seg in result["segments"]:
+            seg = {"start": seg["start"] + start, "end": seg["end"] + start, "text": seg["text"]}
+            if not seg["text"] or seg["start"] < covered - tolerance:
+                continue
+            if not is_last and seg["end"] >= end - tolerance:
+                break
+            segments.append(seg)
+            text = _join_text(text, seg["text"])
+            covered = seg["end"]
+    return text, segments
+
+
+# ========== 转写响应解析：结构化格式 + 单次 JSON 解码 ==========
+# 安装了 orjson 时使用更快的解码器（可选依赖）
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
+    _json_loads = orjson.loads
+else:
+    _json_loads = json.loads
+
+
+def decode_transcription(body: bytes, content_type: str) -> dict:
+    """解析转写接口原始响应为 {"text", "segments"}，分句为 [{"start", "end", "text"}]（秒）"""
+    if "json" in content_type or body.lstrip().startswith(b"{"):
+        try:
+            data = _json_loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            segments = [
+                {"start": float(seg["start"]), "end": float(seg["end"]), "text": seg["text"].strip()}
+                for seg in data.get("segments") or ()
+            ]
+            return {"text": (data.get("text") or "").strip(), "segments": segments}
+    
+    # response_format="text" 时为纯文本
+    return {"text": body.decode("utf-8").strip(), "segments": []}
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数格式化为 mm:ss（超过一小时为 h:mm:ss）"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+# ========== 语音转文字函数（v2.2.1 升级：使用统一客户端 + 错误分类） ==========
+async def _request_transcription(client: "AsyncOpenAI", audio, filename: str, mime_type: str) -> dict:
+    """发送单次转写请求，返回 {"text", "segments"}；audio 为字节（内存直传）或已打开的文件（按块流式上传）"""
+    annotate_metric(upload_bytes=len(audio) if isinstance(audio, bytes) else os.fstat(audio.fileno()).st_size)
+    # (文件名, 内容, MIME) 直接作为 multipart 文件字段；文件对象每次发送前回到开头，重试时可重复发送
+    # 取原始响应自行解码，跳过 SDK 的模型构建
+    response = await client.audio.transcriptions.with_raw_response.create(
+        model=CONFIG['models']['transcribe'],
+        file=(filename, audio, mime_type),
+        response_format=CONFIG['transcription']['response_format']
+    )
+    return decode_transcription(response.content, response.headers.get("content-type", ""))
+
+
+async def _request_wav_chunk(client: "AsyncOpenAI", encode_chunk) -> dict:
+    """取得并发名额后才编码分段并发送；降混与重采样（及内存映射读盘）在线程中执行，不阻塞共享事件循环"""
+    return await _request_transcription(client, await asyncio.to_thread(encode_chunk), "chunk.wav", "audio/wav")
+
+
+def _transcribe_chunks(api_key: str, chunks: list, progress=None) -> dict:
+    """以有界并发转写各分段，按原顺序拼接；各段都有分句时间戳时按时间去重，否则按文本去重"""
+    cfg = CONFIG['long_audio']
+    client = get_async_client(api_key)
+    results = run_bounded(
+        [
+            scheduled(api_key, new_metric("transcribe_chunk", CONFIG['models']['transcribe']), _request_wav_chunk, client, encode)
+            for _, _, encode in chunks
+        ],
+        cfg['max_workers'],
+        progress
+    )
+    if all(result["segments"] or not result["text"] for result in results):
+        text, segments = stitch_segments(results, [(start, end) for start, end, _ in chunks])
+        return {"text": text, "segments": segments}
+    texts = [result["text"] for result in results]
+    return {"text": stitch_transcripts(texts, cfg['stitch_window'], cfg['stitch_min_match']), "segments": []}
+
+
+def transcribe_audio(
+    audio,
+    api_key: str,
+    progress=None,
+    filename: str = "audio.wav",
+    mime_type: str = "audio/wav"
+) -> dict:
+    try:
+        # 相同音频 + 相同模型直接命中缓存，不再调用 API
+        cache = get_transcription_cache()
+        cache_key = cache.make_key(audio, CONFIG['models']['transcribe'])
+        cached = cache.get(cache_key)
+        if cached is not None:
+            get_metrics().record(new_metric(
+                "transcribe", CONFIG['models']['transcribe'],
+                cache_hit=True, status="ok", upload_bytes=len(audio), total=0.0
+            ))
+            return {"success": True, "text": cached["text"], "segments": cached["segments"], "cached": True}
+        
+        if isinstance(audio, SpooledAudio):
+            # 暂存的大文件：WAV 内存映射后逐段预处理，其余格式按块流式上传，均不整体读入内存
+            preprocess_info = None
+            chunks = split_spooled_wav(audio)
+        else:
+            # WAV 预处理后再上传，显著减小体积
+            audio, preprocess_info = preprocess_audio(audio)
+            if preprocess_info and preprocess_info["after"] < preprocess_info["before"]:
+                filename = os.path.splitext(filename)[0] + ".wav"
+                mime_type = "audio/wav"
+            chunks = split_wav_chunks(audio)
+        
+        # 长 WAV 分段并行转写，其余格式整段发送
+        if chunks:
+            transcript = _transcribe_chunks(api_key, chunks, progress)
+        else:
+            client = get_async_client(api_key)
+            with audio.open() if isinstance(audio, SpooledAudio) else contextlib.nullcontext(audio) as upload:
+                transcript = run_async(
+                    scheduled(
+                        api_key, new_metric("transcribe", CONFIG['models']['transcribe']),
+                        _request_transcription, client, upload, filename, mime_type
+                    )
+                )
+        
+        if transcript["text"]:
+            cache.set(cache_key, transcript)
+        
+        return {
+            "success": True,
+            "text": transcript["text"],
+            "segments": transcript["segments"],
+            "cached": False,
+            "preprocess": preprocess_info
+        }
+        
+    except Exception as e:
+        return error_result(e)
+
+# ========== 简报模板 ==========
+PROMPTS = {
+    "会议纪要": "整理成会议纪要：1主题 2讨论 3决议 4待办",
+    "工作日报": "整理成工作日报：1完成 2问题 3计划",
+    "学习笔记": "整理成学习笔记：1概念 2重点 3思考",
+    "新闻摘要": "整理成新闻摘要：1事件 2数据 3影响"
+}
+
+def build_system_prompt(briefing_type: str, custom_req: str = "") -> str:
+    """根据简报类型与特殊要求拼装系统提示"""
+    prompt = PROMPTS[briefing_type]
+    if custom_req:
+        prompt += f"。要求：{custom_req}"
+    return prompt
+
+# ========== 生成函数 ==========
+def _chat_messages(system_prompt: str, content: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content}
+    ]
+
+
+async def _create_chat(client: "AsyncOpenAI", system_prompt: str, content: str, max_tokens: int = None) -> str:
+    """发送一次非流式生成请求"""
+    response = await client.chat.completions.create(
+        model=CONFIG['models']['generate'],
+        messages=_chat_messages(system_prompt, content),
+        temperature=CONFIG['generate']['temperature'],
+        max_tokens=max_tokens or CONFIG['generate']['max_tokens']
+    )
+    annotate_usage(response.usage)
+    return response.choices[0].message.content
+
+
+async def _stream_chat(client: "AsyncOpenAI", system_prompt: str, content: str, max_tokens: int = None):
+    """发送流式生成请求，逐个返回增量文本"""
+    stream = await client.chat.completions.create(
+        model=CONFIG['models']['generate'],
+        messages=_chat_messages(system_prompt, content),
+        temperature=CONFIG['generate']['temperature'],
+        max_tokens=max_tokens or CONFIG['generate']['max_tokens'],
+        stream=True
+    )
+    async for chunk in stream:
+        # 兼容接口通常在流中附带 usage（最后一块为准）
+        annotate_usage(getattr(chunk, "usage", None))
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def generate_briefing(api_key: str, system_prompt: str, content: str, stats: dict, max_tokens: int = None) -> str:
+    """一次性生成简报；总耗时写入 stats"""
+    start = time.perf_counter()
+    client = get_async_client(api_key)
+    metric = new_metric("generate", CONFIG['models']['generate'])
+    result = run_async(scheduled(api_key, metric, _create_chat, client, system_prompt, content, max_tokens))
+    stats["total"] = time.perf_counter() - start
+    return result
+
+def stream_briefing(api_key: str, system_prompt: str, content: str, stats: dict, max_tokens: int = None):
+    """流式生成简报，逐段返回累计文本；首字延迟与总耗时写入 stats"""
+    start = time.perf_counter()
+    client = get_async_client(api_key)
+    metric = new_metric("generate_stream", CONFIG['models']['generate'])
+    deltas = scheduled_stream(api_key, metric, _stream_chat, client, system_prompt, content, max_tokens)
+    
+    parts = []
+    for delta in iter_async(deltas):
+        if "ttft" not in stats:
+            stats["ttft"] = time.perf_counter() - start
+        parts.append(delta)
+        yield "".join(parts)
+    
+    stats["total"] = time.perf_counter() - start
+
+# ========== 长文本分段提炼（map-reduce） ==========
+MAP_PROMPT = (
+    "以下是一段长文本中按顺序截取的片段。请提炼该片段的要点，"
+    "保留关键事实、数据、人物、决定与待办，使用简洁的要点列表，不要添加片段以外的信息"
+)
+REDUCE_HINT = "\n（输入为原文按顺序分段提炼的要点，请整合后输出）"
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+# 句末标点（中英文）或换行之后切分
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer():
+    """加载本地分词器（可选依赖 tokenizers）；未配置或不可用时返回 None"""
+    path = CONFIG['budget']['tokenizer_path']
+    if not path or not os.path.exists(path) or importlib.util.find_spec("tokenizers") is None:
+        return None
+    from tokenizers import Tokenizer
+    return Tokenizer.from_file(path)
+
+
+def count_tokens(text: str) -> int:
+    """统计 token 数：配置了分词器时精确计数，否则使用离线估算"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def plan_budget(briefing_type: str, system_prompt: str, content: str) -> dict:
+    """生成前的 token 预算：估算提示长度，按简报类型与输入规模确定输出上限，
+    输入超出单次处理范围或模型上下文时改走分段提炼"""
+    cfg = CONFIG['budget']
+    output = cfg['output'].get(briefing_type, cfg['output']['default'])
+    content_tokens = count_tokens(content)
+    prompt_tokens = count_tokens(system_prompt) + content_tokens
+    max_tokens = int(min(output['max'], max(output['min'], content_tokens * output['ratio'])))
+    available = cfg['context_tokens'] - cfg['reserve_tokens'] - prompt_tokens
+    
+    plan = {"prompt_tokens": prompt_tokens, "max_tokens": max_tokens, "route": "direct", "warning": None}
+    if available < output['min']:
+        plan["max_tokens"] = output['min']
+        plan["warning"] = f"输入约 {prompt_tokens} tokens，超出模型上下文（{cfg['context_tokens']}）的可用范围"
+    elif available < max_tokens:
+        plan["max_tokens"] = available
+        plan["warning"] = f"输入接近模型上下文上限，输出上限压缩至 {available} tokens"
+    if available < output['min'] or content_tokens > CONFIG['map_reduce']['threshold_tokens']:
+        plan["route"] = "map_reduce"
+    return plan
+
+
+def split_text_segments(text: str, max_tokens: int) -> list:
+    """按句子/段落边界将文本切分为不超过 token 预算的片段"""
+    segments, current, current_tokens = [], [], 0
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        if not sentence:
+            continue
+        tokens = count_tokens(sentence)
+        
+        # 单句超出预算时按字符硬切
+        if tokens > max_tokens:
+            step = max(1, len(sentence) * max_tokens // tokens)
+            pieces = [sentence[i:i + step] for i in range(0, len(sentence), step)]
+        else:
+            pieces = [sentence]
+        
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                segments.append("".join(current).strip())
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    
+    if current:
+        segments.append("".join(current).strip())
+    return [seg for seg in segments if seg]
+
+
+async def _unless_cancelled(cancelled, make_call):
+    """取得并发名额后、发出请求前检查取消；已取消时不再创建 API 调用"""
+    if cancelled():
+        raise JobCancelled()
+    return await make_call()
+
+
+def map_reduce_inputs(
+    api_key: str,
+    system_prompt: str,
+    content: str,
+    stats: dict,
+    progress=None,
+    cancelled=lambda: False
+) -> tuple:
+    """并发提炼各片段要点（map），返回用于最终汇总（reduce）的 (系统提示, 内容)；取消时抛出 JobCancelled"""
+    cfg = CONFIG['map_reduce']
+    start = time.perf_counter()
+    text = content
+    
+    client = get_async_client(api_key)
+    
+    for _ in range(cfg['max_levels']):
+        if count_tokens(text) <= cfg['threshold_tokens']:
+            break
+        segments = split_text_segments(text, cfg['segment_tokens'])
+        # 任一片段发现已取消即失败，run_bounded 随即取消其余片段
+        summaries = run_bounded(
+            [
+                _unless_cancelled(cancelled, functools.partial(
+                    scheduled, api_key, new_metric("generate_map", CONFIG['models']['generate']),
+                    _create_chat, client, MAP_PROMPT, seg, cfg['map_max_tokens']
+                ))
+                for seg in segments
+            ],
+            cfg['max_workers'],
+            progress
+        )
+        text = "\n\n".join(f"【第{i}段】\n{summary}" for i, summary in enumerate(summaries, start=1))
+        stats["segments"] = stats.get("segments", 0) + len(segments)
+    
+    stats["map"] = time.perf_counter() - start
+    return system_prompt + REDUCE_HINT, text
+
+# ========== 后台任务：进程级线程池，跨 rerun 持续运行 ==========
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+class Job:
+    """后台任务状态：由工作线程写入，页面轮询读取"""
+    
+    def __init__(self, kind: str, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.label = label
+        self.status = "queued"          # queued / running / done / failed / cancelled
+        self.stage = "排队中"
+        self.progress = None            # (已完成, 总数)
+        self.partial = None             # 流式生成的部分结果
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+    
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+    
+    def cancel(self):
+        self._cancel.set()
+    
+    def set_progress(self, done: int, total: int):
+        self.progress = (done, total)
+    
+    def snapshot(self) -> dict:
+        """可 JSON 序列化的状态快照（同步到共享后端供其他副本读取）"""
+        data = {
+            key: getattr(self, key)
+            for key in ("id", "kind", "label", "status", "stage", "progress", "partial", "result", "created", "finished")
+        }
+        data["error"] = None if self.error is None else str(self.error)
+        for key in ("items", "partials"):
+            if hasattr(self, key):
+                data[key] = getattr(self, key)
+        return data
+
+
+class RemoteJob(Job):
+    """在其他副本上运行的任务（只读快照）；取消请求经共享后端转交执行副本"""
+    
+    def __init__(self, backend, data: dict, retention: float):
+        super().__init__(data["kind"], data["label"])
+        for key in ("id", "status", "stage", "partial", "result", "created", "finished"):
+            setattr(self, key, data[key])
+        self.progress = tuple(data["progress"]) if data["progress"] else None
+        self.error = Exception(data["error"]) if data["error"] else None
+        for key in ("items", "partials"):
+            if key in data:
+                setattr(self, key, data[key])
+        self._backend = backend
+        self._retention = retention
+    
+    def cancel(self):
+        super().cancel()
+        try:
+            self._backend.set(f"job-cancel:{self.id}", b"1", ttl=self._retention)
+        except SharedBackendError:
+            pass
+
+
+class JobManager:
+    """进程级后台任务池：任务脱离脚本线程执行，页面 rerun 不会中断
+    
+    共享后端为多副本时，本副本的任务状态定期同步到后端，其他副本可查询任务并转交取消请求。
+    """
+    
+    def __init__(self, max_workers: int, retention: float, backend=None, sync_interval: float = 0.5):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="briefing-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.backend = backend if backend is not None and backend.shared else None
+        self._unsynced = set()
+        if self.backend is not None:
+            self.sync_interval = sync_interval
+            threading.Thread(target=self._sync_loop, name="briefing-job-sync", daemon=True).start()
+    
+    def submit(self, kind: str, func, *args, label: str = "", **kwargs) -> Job:
+        """提交任务，func 的第一个参数为 Job，用于上报阶段与进度"""
+        job = Job(kind, label)
+        self._prune()
+        with self._lock:
+            self._jobs[job.id] = job
+            if self.backend is not None:
+                self._unsynced.add(job.id)
+        if self.backend is not None:
+            # 立即发布，避免其他副本在首次同步前查不到任务
+            self._publish(job)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+    
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and job_id and self.backend is not None:
+            data = shared_get_json(self.backend, f"job:{job_id}")
+            if data is not None:
+                job = RemoteJob(self.backend, data, self.retention)
+        return job
+    
+    # ---------- 多副本同步 ----------
+    def _publish(self, job: Job) -> bool:
+        """写入任务快照并检查其他副本转交的取消请求；返回任务是否已结束并完成最终同步"""
+        # 先读结束标志再取快照，保证最后一次同步包含最终结果
+        final = job.done
+        try:
+            shared_set_json(self.backend, f"job:{job.id}", job.snapshot(), self.retention)
+        except RuntimeError:
+            # 工作线程正在修改批量条目，下一轮再同步
+            return False
+        if not final and not job.cancelled:
+            try:
+                if self.backend.get(f"job-cancel:{job.id}"):
+                    job.cancel()
+            except SharedBackendError:
+                pass
+        return final
+    
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            with self._lock:
+                jobs = [self._jobs[job_id] for job_id in self._unsynced if job_id in self._jobs]
+            for job in jobs:
+                if self._publish(job):
+                    with self._lock:
+                        self._unsynced.discard(job.id)
+    
+    def _run(self, job: Job, func, args, kwargs):
+        if job.cancelled:
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        job.status = "running"
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+    
+    def _prune(self):
+        # 清理已结束且超过保留期的任务（如会话已关闭无人领取）
+        # 工作线程先写状态再写结束时间，finished 仍为 None 的任务视为未结束
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for job_id in [jid for jid, job in self._jobs.items()
+                           if job.finished is not None and job.finished < cutoff]:
+                del self._jobs[job_id]
+                self._unsynced.discard(job_id)
+
+
+@functools.lru_cache(maxsize=None)
+def get_job_manager() -> JobManager:
+    """获取进程级后台任务池（所有会话共享）"""
+    return JobManager(
+        CONFIG['jobs']['max_workers'],
+        CONFIG['jobs']['retention'],
+        backend=get_shared_backend(),
+        sync_interval=CONFIG['shared']['job_sync_interval']
+    )
+
+
+def transcribe_job(job: Job, audio, api_key: str, filename: str, mime_type: str, history: bool = True) -> dict:
+    """后台转写任务（audio 为字节或 SpooledAudio，暂存文件在任务结束时删除）；成功后写入历史记录（边录边转的片段不单独记录）"""
+    job.stage = "转写中"
+    try:
+        result = transcribe_audio(audio, api_key, progress=job.set_progress, filename=filename, mime_type=mime_type)
+    finally:
+        if isinstance(audio, SpooledAudio):
+            audio.remove()
+    if history and result["success"] and result["text"].strip():
+        result["history_id"] = record_history(
+            transcript=result["text"], audio_hash=audio_hash(audio), source=filename
+        )
+    return result
+
+
+def generation_cache_key(briefing_type: str, system_prompt: str, content: str) -> str:
+    """单类型与多类型生成共用的缓存键：按所选模板的系统提示、原始内容与预算给出的输出上限计算，
+    模板或预算配置改动后旧结果不再命中"""
+    return GenerationCache.make_key(
+        system_prompt, content,
+        CONFIG['models']['generate'],
+        CONFIG['generate']['temperature'],
+        plan_budget(briefing_type, system_prompt, content)["max_tokens"]
+    )
+
+
+def run_generation(
+    api_key: str,
+    briefing_type: str,
+    custom_req: str,
+    content: str,
+    stream: bool = True,
+    force: bool = False,
+    job: Job = None
+) -> tuple:
+    """完整生成流程：查缓存 → token 预算（超长文本分段提炼）→ 生成并写入缓存，返回 (结果, 统计)"""
+    prompt = build_system_prompt(briefing_type, custom_req)
+    
+    # 相同提示 + 内容 + 模型 + 温度 + 输出上限直接复用缓存结果
+    gen_cache = get_generation_cache()
+    cache_key = generation_cache_key(briefing_type, prompt, content)
+    cached_result = None if force else gen_cache.get(cache_key)
+    if cached_result is not None:
+        get_metrics().record(new_metric(
+            "generate", CONFIG['models']['generate'],
+            cache_hit=True, status="ok", total=0.0
+        ))
+        return cached_result, {"cached": True}
+    
+    stats = {}
+    gen_prompt, gen_content = prompt, content
+    cancelled = lambda: job is not None and job.cancelled
+    
+    # 超长文本先分段并行提炼，再用所选模板汇总；输出上限按汇总时的实际输入重新计算
+    budget = plan_budget(briefing_type, prompt, content)
+    if budget["route"] == "map_reduce":
+        if job:
+            job.stage = "分段提炼中"
+        gen_prompt, gen_content = map_reduce_inputs(
+            api_key, prompt, content, stats,
+            progress=job.set_progress if job else None,
+            cancelled=cancelled
+        )
+        budget = plan_budget(briefing_type, gen_prompt, gen_content)
+    stats["prompt_tokens"], stats["max_tokens"] = budget["prompt_tokens"], budget["max_tokens"]
+    if budget["warning"]:
+        stats["budget_warning"] = budget["warning"]
+    
+    # 提炼期间或生成前已取消（如预生成被丢弃）时不再发出汇总 / 非流式请求
+    if cancelled():
+        raise JobCancelled()
+    if job:
+        job.stage = "生成中"
+        job.progress = None
+    if stream:
+        result = ""
+        for result in stream_briefing(api_key, gen_prompt, gen_content, stats, budget["max_tokens"]):
+            if job:
+                if job.cancelled:
+                    raise JobCancelled()
+                job.partial = result
+    else:
+        result = generate_briefing(api_key, gen_prompt, gen_content, stats, budget["max_tokens"])
+    
+    if result:
+        gen_cache.set(cache_key, result)
+    return result, stats
+
+
+def generate_job(
+    job: Job,
+    api_key: str,
+    briefing_type: str,
+    custom_req: str,
+    content: str,
+    history_id: int = None,
+    speculative: bool = False,
+    **kwargs
+) -> tuple:
+    """后台生成任务；完成后把简报写回历史记录（预生成任务被采用时才由页面写入）"""
+    result, stats = run_generation(api_key, briefing_type, custom_req, content, job=job, **kwargs)
+    if result and not speculative:
+        stats["history_id"] = record_briefing(
+            history_id, content, briefing_type, custom_req, result, cached=stats.get("cached", False)
+        )
+    return result, stats
+
+
+# ========== 预生成：转写完成即按当前设置在后台生成 ==========
+class SpeculationStats:
+    """预生成计数（进程级）：发起 / 被采用 / 生成中被取消 / 完成但未采用，及后两者估算消耗的 token"""
+    
+    EVENTS = ("started", "reused", "cancelled", "wasted")
+    
+    def __init__(self):
+        self.counts = dict.fromkeys(self.EVENTS, 0)
+        self.wasted_tokens = 0
+        self._lock = threading.Lock()
+    
+    def record(self, event: str, tokens: int = 0):
+        with self._lock:
+            self.counts[event] += 1
+            self.wasted_tokens += tokens
+
+
+@functools.lru_cache(maxsize=None)
+def get_speculation_stats() -> SpeculationStats:
+    """获取进程级预生成计数（所有会话共享）"""
+    return SpeculationStats()
+
+
+def start_speculation(api_key: str, briefing_type: str, custom_req: str, content: str, stream: bool = True) -> Job:
+    """提交预生成任务；结果不写历史，由 settle_speculation 决定采用或丢弃"""
+    job = get_job_manager().submit(
+        "generate", generate_job,
+        api_key, briefing_type, custom_req, content,
+        speculative=True, stream=stream, label=briefing_type
+    )
+    get_speculation_stats().record("started")
+    return job
+
+
+def settle_speculation(job, reused: bool, briefing_type: str, custom_req: str, content: str):
+    """结束一次预生成：采用，或取消仍在进行的任务并把已产生的消耗计入浪费"""
+    counter = get_speculation_stats()
+    if reused:
+        counter.record("reused")
+        return
+    if job is None:
+        return
+    
+    prompt_tokens = plan_budget(briefing_type, build_system_prompt(briefing_type, custom_req), content)["prompt_tokens"]
+    if job.status == "done":
+        result, stats = job.result
+        counter.record("wasted", 0 if stats.get("cached") else prompt_tokens + count_tokens(result or ""))
+    elif job.done:
+        counter.record("wasted")
+    else:
+        job.cancel()
+        # 已开始输出说明请求已发出，提示与已生成部分均计入消耗
+        counter.record("cancelled", prompt_tokens + count_tokens(job.partial) if job.partial else 0)
+
+
+# ========== 多类型并发生成：转写内容作为共享前缀 ==========
+# 各请求的系统提示与用户消息开头完全一致，仅末尾的整理要求不同，服务端前缀缓存可复用已计算的转写部分
+FANOUT_SYSTEM = "你是专业的简报助手。用户消息先给出原始内容，最后给出整理要求，请只按整理要求输出"
+FANOUT_REQUEST = "\n\n【整理要求】{prompt}"
+
+
+def fanout_generation(
+    api_key: str,
+    briefing_types: list,
+    custom_req: str,
+    content: str,
+    force: bool = False,
+    job: Job = None
+) -> dict:
+    """一份内容并发生成多种简报，返回 {简报类型: (结果, 统计)}；单个类型失败时结果为 None，统计含 error
+    
+    首个请求开始输出（前缀已由服务端计算并缓存）后再发出其余请求，总耗时约为最慢一份加一次首字延迟。
+    超长内容只做一次分段提炼，各类型共用提炼结果。
+    """
+    gen_cache = get_generation_cache()
+    results, pending = {}, []
+    for briefing_type in briefing_types:
+        prompt = build_system_prompt(briefing_type, custom_req)
+        # 与单类型生成共用缓存键，两种方式的结果互相复用
+        cache_key = generation_cache_key(briefing_type, prompt, content)
+        cached_result = None if force else gen_cache.get(cache_key)
+        if cached_result is not None:
+            get_metrics().record(new_metric(
+                "generate_fanout", CONFIG['models']['generate'],
+                cache_hit=True, status="ok", total=0.0
+            ))
+            results[briefing_type] = (cached_result, {"cached": True})
+        else:
+            pending.append((briefing_type, prompt, cache_key))
+    if not pending:
+        return results
+    
+    shared_stats, body, hint = {}, content, ""
+    if any(plan_budget(t, FANOUT_SYSTEM + p, content)["route"] == "map_reduce" for t, p, _ in pending):
+        if job:
+            job.stage = "分段提炼中"
+        _, body = map_reduce_inputs(
+            api_key, "", content, shared_stats,
+            progress=job.set_progress if job else None,
+            cancelled=lambda: job is not None and job.cancelled
+        )
+        hint = REDUCE_HINT
+    if job and job.cancelled:
+        raise JobCancelled()
+    
+    if job:
+        job.stage = "生成中"
+        job.progress = (len(results), len(briefing_types))
+        job.partials = {}
+    client = get_async_client(api_key)
+    
+    async def generate_one(briefing_type: str, prompt: str, cache_key: str, first_token: asyncio.Event):
+        stats = dict(shared_stats)
+        request = body + FANOUT_REQUEST.format(prompt=prompt + hint)
+        budget = plan_budget(briefing_type, FANOUT_SYSTEM + prompt, request)
+        stats["prompt_tokens"], stats["max_tokens"] = budget["prompt_tokens"], budget["max_tokens"]
+        if budget["warning"]:
+            stats["budget_warning"] = budget["warning"]
+        
+        start = time.perf_counter()
+        metric = new_metric("generate_fanout", CONFIG['models']['generate'])
+        parts = []
+        try:
+            async for delta in scheduled_stream(
+                api_key, metric, _stream_chat, client, FANOUT_SYSTEM, request, budget["max_tokens"]
+            ):
+                if "ttft" not in stats:
+                    stats["ttft"] = time.perf_counter() - start
+                    first_token.set()
+                parts.append(delta)
+                if job:
+                    if job.cancelled:
+                        raise JobCancelled()
+                    job.partials[briefing_type] = "".join(parts)
+        finally:
+            # 首个请求失败时也放行其余请求
+            first_token.set()
+        
+        stats["total"] = time.perf_counter() - start
+        if metric.get("cached_tokens"):
+            stats["cached_tokens"] = metric["cached_tokens"]
+        result = "".join(parts)
+        if result:
+            gen_cache.set(cache_key, result)
+        if job:
+            done, total = job.progress
+            job.progress = (done + 1, total)
+        return result, stats
+    
+    async def generate_all() -> list:
+        first_token = asyncio.Event()
+        leader = asyncio.ensure_future(generate_one(*pending[0], first_token))
+        if CONFIG['fanout']['prefix_warmup'] and len(pending) > 1:
+            await first_token.wait()
+        rest = [generate_one(*item, first_token) for item in pending[1:]]
+        return await asyncio.gather(leader, *rest, return_exceptions=True)
+    
+    for (briefing_type, _, _), outcome in zip(pending, run_async(generate_all())):
+        if isinstance(outcome, JobCancelled):
+            raise outcome
+        if isinstance(outcome, Exception):
+            results[briefing_type] = (None, {"error": error_result(outcome)})
+        else:
+            results[briefing_type] = outcome
+    return {briefing_type: results[briefing_type] for briefing_type in briefing_types}
+
+
+def fanout_job(
+    job: Job,
+    api_key: str,
+    briefing_types: list,
+    custom_req: str,
+    content: str,
+    history_id: int = None,
+    force: bool = False
+) -> dict:
+    """后台多类型生成任务；每份简报写回历史记录（首份挂到转写记录，其余另存）"""
+    results = fanout_generation(api_key, briefing_types, custom_req, content, force=force, job=job)
+    for briefing_type, (result, stats) in results.items():
+        if result:
+            stats["history_id"] = record_briefing(
+                history_id, content, briefing_type, custom_req, result, cached=stats.get("cached", False)
+            )
+    return results
+
+
+# ========== 批量模式：多文件并发转写 + 生成 ==========
+def brief_audio(
+    item: dict,
+    audio,
+    api_key: str,
+    briefing_type: str,
+    custom_req: str = "",
+    mime_type: str = "application/octet-stream",
+    cancelled=lambda: False
+) -> dict:
+    """单个文件：转写 + 生成简报，阶段与结果写入 item（批量任务与命令行共用）"""
+    try:
+        if cancelled():
+            item["stage"] = "已取消"
+            return item
+        
+        item["stage"] = "转写中"
+        result = transcribe_audio(audio, api_key, filename=item["name"], mime_type=mime_type)
+        if not result["success"]:
+            item["stage"], item["error"] = "失败", result
+            return item
+        item["transcript"] = result["text"]
+        if not result["text"].strip():
+            item["stage"] = "转写为空"
+            return item
+        
+        if cancelled():
+            item["stage"] = "已取消"
+            return item
+        item["stage"] = "生成中"
+        item["briefing"], _ = run_generation(api_key, briefing_type, custom_req, result["text"], stream=False)
+        item["stage"] = "完成"
+        record_history(
+            transcript=result["text"], audio_hash=audio_hash(audio), source=item["name"],
+            briefing_type=briefing_type, custom_req=custom_req, result=item["briefing"]
+        )
+    except Exception as e:
+        item["stage"], item["error"] = "失败", error_result(e)
+    return item
+
+
+def new_batch_item(name: str) -> dict:
+    """批量结果条目：文件名、当前阶段、转写、简报与错误"""
+    return {"name": name, "stage": "排队中", "transcript": None, "briefing": None, "error": None}
+
+
+def batch_job(job: Job, files: list, api_key: str, briefing_type: str, custom_req: str) -> list:
+    """后台批量任务：以有界并发逐个文件转写并生成简报，结果按上传顺序排列"""
+    job.stage = "批量处理中"
+    job.items = [new_batch_item(name) for name, _, _ in files]
+    finished = [0]
+    lock = threading.Lock()
+    
+    def process(index: int):
+        _, audio, mime_type = files[index]
+        try:
+            brief_audio(
+                job.items[index], audio, api_key, briefing_type, custom_req,
+                mime_type=mime_type, cancelled=lambda: job.cancelled
+            )
+        finally:
+            if isinstance(audio, SpooledAudio):
+                audio.remove()
+            with lock:
+                finished[0] += 1
+                job.set_progress(finished[0], len(files))
+    
+    with ThreadPoolExecutor(max_workers=CONFIG['batch']['concurrency'], thread_name_prefix="briefing-batch") as executor:
+        list(executor.map(process, range(len(files))))
+    return job.items
+
+
+def build_batch_markdown(items: list, briefing_type: str) -> str:
+    """合并批量结果为一份 Markdown（按上传顺序）"""
+    sections = []
+    for i, item in enumerate(items, start=1):
+        body = item["briefing"] or item["transcript"] or f"（{item['stage']}）"
+        sections.append(f"## {i}. {item['name']}\n\n**{briefing_type}**\n\n{body}")
+    return f"# 批量简报（{len(items)} 个文件）\n\n" + "\n\n---\n\n".join(sections) + "\n"
+
+
+def build_batch_zip(items: list, briefing_type: str) -> bytes:
+    """打包批量结果：每个文件一份简报 + 转写原文，外加合并版 Markdown"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, item in enumerate(items, start=1):
+            stem = f"{i:02d}_{os.path.splitext(item['name'])[0]}"
+            if item["briefing"]:
+                zf.writestr(f"{stem}_{briefing_type}.md", item["briefing"])
+            if item["transcript"]:
+                zf.writestr(f"{stem}_转写.txt", item["transcript"])
+        zf.writestr("合并简报.md", build_batch_markdown(items, briefing_type))
+    return buf.getvalue()
+
+
+def error_result(error: Exception) -> dict:
+    """将异常转换为统一的错误结果"""
+    error_info = classify_error(error)
+    return {
+        "success": False, 
+        "error_type": error_info["type"],
+        "error_title": error_info["title"],
+        "error_message": error_info["message"],
+        "error_action": error_info["action"],
+        "error_raw": str(error)
+    }
@@ -0,0 +1,116 @@
+"""AI语音简报助手命令行：无界面批量处理目录中的录音，简报写入磁盘
+
+用法示例：
+    SILICONFLOW_API_KEY=sk-xxx python cli.py recordings/ -o briefings/ -t 会议纪要 -j 8
+"""
+import argparse
+import mimetypes
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from briefing_core import CONFIG, PROMPTS, SpooledAudio, brief_audio, new_batch_item
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.webm', '.ogg')
+
+
+def find_audio_files(directory: str, recursive: bool) -> list:
+    """按文件名排序列出目录中的录音文件"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(
+            os.path.join(root, name) for name in sorted(files)
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+        if not recursive:
+            break
+    return paths
+
+
+def output_paths(path: str, args) -> tuple:
+    """简报与转写文本的输出路径（保留输入目录的相对结构）"""
+    stem = os.path.splitext(os.path.relpath(path, args.input))[0]
+    base = os.path.join(args.output, stem)
+    return f"{base}_{args.type}.md", f"{base}_转写.txt"
+
+
+def process_file(path: str, api_key: str, args) -> dict:
+    """转写并生成单个文件的简报，写入输出目录"""
+    item = new_batch_item(os.path.basename(path))
+    if os.path.getsize(path) >= CONFIG['upload']['spool_threshold']:
+        # 大文件直接引用磁盘文件，转写时按块读取
+        audio = SpooledAudio.from_path(path)
+    else:
+        with open(path, "rb") as f:
+            audio = f.read()
+    mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    brief_audio(item, audio, api_key, args.type, args.custom, mime_type=mime_type)
+    
+    briefing_path, transcript_path = output_paths(path, args)
+    os.makedirs(os.path.dirname(briefing_path), exist_ok=True)
+    if item["transcript"] and args.save_transcript:
+        with open(transcript_path, "w", encoding="utf-8") as f:
+            f.write(item["transcript"])
+    if item["briefing"]:
+        with open(briefing_path, "w", encoding="utf-8") as f:
+            f.write(item["briefing"])
+    return item
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量转写录音并生成简报")
+    parser.add_argument("input", help="录音文件所在目录")
+    parser.add_argument("-o", "--output", default="briefings", help="简报输出目录（默认 briefings/）")
+    parser.add_argument("-t", "--type", default="会议纪要", choices=list(PROMPTS), help="简报类型")
+    parser.add_argument("-c", "--custom", default="", help="特殊要求")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=CONFIG['batch']['concurrency'],
+        help="同时处理的文件数（API 请求仍受 CONFIG['scheduler'] 限流）"
+    )
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    parser.add_argument("--skip-existing", action="store_true", help="跳过已有简报的文件，便于中断后续跑")
+    parser.add_argument("--no-transcript", dest="save_transcript", action="store_false", help="不保存转写原文")
+    parser.add_argument("--api-key", default=os.environ.get("SILICONFLOW_API_KEY", ""), help="默认读取环境变量 SILICONFLOW_API_KEY")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.api_key.startswith("sk-"):
+        print("❌ 请通过 --api-key 或环境变量 SILICONFLOW_API_KEY 提供 API 密钥（以 sk- 开头）", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.input):
+        print(f"❌ 目录不存在：{args.input}", file=sys.stderr)
+        return 2
+    
+    paths = find_audio_files(args.input, args.recursive)
+    if args.skip_existing:
+        paths = [p for p in paths if not os.path.exists(output_paths(p, args)[0])]
+    if not paths:
+        print("没有需要处理的录音文件")
+        return 0
+    
+    print(f"🎙️ 共 {len(paths)} 个文件，并发 {args.jobs}，输出到 {args.output}")
+    start = time.perf_counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="briefing-cli") as executor:
+        futures = {executor.submit(process_file, path, args.api_key, args): path for path in paths}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                item = future.result()
+            except OSError as e:
+                item = {"stage": "失败", "error": {"error_title": "读写失败", "error_message": str(e)}}
+            if item["stage"] != "完成":
+                failed += 1
+            detail = f"：{item['error']['error_title']} - {item['error']['error_message']}" if item["error"] else ""
+            print(f"[{done}/{len(paths)}] {item['stage']} {path}{detail}", flush=True)
+    
+    print(f"✅ 完成 {len(paths) - failed}/{len(paths)}，用时 {time.perf_counter() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
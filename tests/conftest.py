@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def mock_api(tmp_path_factory):
+    """本地模拟接口；缓存、指标日志与历史记录写入临时目录"""
+    import briefing_core as core
+    from mock_server import start_server
+    from run import configure_core
+    
+    server, state, base_url = start_server(latency=0.01, jitter=0.0, stream_interval=0.001)
+    configure_core(base_url, str(tmp_path_factory.mktemp("briefing")))
+    yield state
+    server.shutdown()
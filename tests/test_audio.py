@@ -0,0 +1,46 @@
+"""音频预处理：空音频与极短音频不应报错，分段编码不占用事件循环"""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import briefing_core as core
+
+
+@pytest.mark.parametrize("frames", [0, 1, 2])
+def test_preprocess_short_wav(frames):
+    audio = core.write_wav(np.zeros((frames, 2), dtype="<i2"), 48000, 2)
+    processed, info = core.preprocess_audio(audio)
+    assert info["before"] == len(audio)
+    assert core.read_wav(processed) is not None
+
+
+@pytest.mark.parametrize("length", [0, 1, 2])
+def test_resample_short_input(length):
+    mono = np.ones(length, dtype=np.float32)
+    assert len(core.resample(mono, 48000, 16000)) == length
+    assert len(core.resample(mono, 44100, 16000)) == length
+
+
+def test_resample_ratio():
+    mono = np.arange(48000, dtype=np.float32)
+    assert len(core.resample(mono, 48000, 16000)) == 16000
+    assert len(core.resample(mono, 44100, 16000)) == int(48000 / (44100 / 16000))
+
+
+def test_wav_chunk_encoded_off_event_loop(monkeypatch):
+    threads = {}
+    
+    def encode():
+        threads["encode"] = threading.get_ident()
+        return b"RIFF"
+    
+    async def fake_request(client, audio, filename, mime_type):
+        threads["loop"] = threading.get_ident()
+        return {"text": audio.decode(), "segments": []}
+    
+    monkeypatch.setattr(core, "_request_transcription", fake_request)
+    result = asyncio.run(core._request_wav_chunk(None, encode))
+    assert result["text"] == "RIFF"
+    assert threads["encode"] != threads["loop"]
@@ -0,0 +1,107 @@
+"""生成流程：任务取消后不再发出提炼、汇总与非流式请求"""
+import itertools
+
+import pytest
+
+import briefing_core as core
+
+_seed = itertools.count()
+
+
+def long_content() -> str:
+    """每次内容不同，避免命中生成缓存"""
+    seed = next(_seed)
+    return "".join(f"第{seed}-{i}段讨论了项目进度与预算。" for i in range(40))
+
+
+@pytest.fixture
+def small_map_reduce(monkeypatch):
+    monkeypatch.setitem(core.CONFIG['map_reduce'], "threshold_tokens", 60)
+    monkeypatch.setitem(core.CONFIG['map_reduce'], "segment_tokens", 40)
+    monkeypatch.setitem(core.CONFIG['map_reduce'], "max_workers", 1)
+    # 模拟接口的提炼结果长度固定，多层提炼无法收敛到阈值以下
+    monkeypatch.setitem(core.CONFIG['map_reduce'], "max_levels", 1)
+
+
+def test_cancelled_before_generate_sends_nothing(mock_api):
+    job = core.Job("generate")
+    job.cancel()
+    before = mock_api.counts["chat"]
+    with pytest.raises(core.JobCancelled):
+        core.run_generation("sk-test", "会议纪要", "", "短内容" + long_content()[:20], stream=False, job=job)
+    assert mock_api.counts["chat"] == before
+
+
+def test_cancel_during_map_stops_remaining_segments(mock_api, small_map_reduce):
+    content = long_content()
+    segments = len(core.split_text_segments(content, 40))
+    assert segments > 3
+    
+    class CancelAfterFirst(core.Job):
+        def set_progress(self, done, total):
+            super().set_progress(done, total)
+            self.cancel()
+    
+    job = CancelAfterFirst("generate")
+    before = mock_api.counts["chat"]
+    with pytest.raises(core.JobCancelled):
+        core.run_generation("sk-test", "会议纪要", "", content, stream=False, job=job)
+    # 最多已发出正在进行的一两段，其余片段与最终汇总都不再请求
+    assert mock_api.counts["chat"] - before <= 2
+
+
+def test_speculative_job_cancelled_in_map_reduce(mock_api, small_map_reduce):
+    job = core.get_job_manager().submit(
+        "generate", core.generate_job, "sk-test", "会议纪要", "", long_content(),
+        speculative=True, stream=False
+    )
+    job.cancel()
+    for _ in range(200):
+        if job.done:
+            break
+        core.time.sleep(0.01)
+    assert job.status == "cancelled"
+
+
+def test_map_reduce_completes_when_not_cancelled(mock_api, small_map_reduce):
+    job = core.Job("generate")
+    result, stats = core.run_generation("sk-test", "会议纪要", "", long_content(), stream=False, job=job)
+    assert result
+    assert stats["segments"] > 3
+
+
+def test_fanout_and_single_generation_share_cache(mock_api):
+    content = long_content()[:200]
+    results = core.fanout_generation("sk-test", ["会议纪要", "工作日报"], "", content)
+    assert all(result for result, _ in results.values())
+    
+    result, stats = core.run_generation("sk-test", "工作日报", "", content, stream=False)
+    assert stats == {"cached": True}
+    assert result == results["工作日报"][0]
+
+
+def test_cache_key_follows_prompt_and_budget(monkeypatch):
+    prompt = core.build_system_prompt("会议纪要")
+    key = core.generation_cache_key("会议纪要", prompt, "内容")
+    
+    # 模板改动后系统提示不同，不再命中
+    monkeypatch.setitem(core.PROMPTS, "会议纪要", core.PROMPTS["会议纪要"] + " 5风险")
+    assert core.generation_cache_key("会议纪要", core.build_system_prompt("会议纪要"), "内容") != key
+    
+    # 预算输出上限改动后同样不再命中
+    output = dict(core.CONFIG['budget']['output']["会议纪要"], min=123, max=123)
+    monkeypatch.setitem(core.CONFIG['budget']['output'], "会议纪要", output)
+    assert core.generation_cache_key("会议纪要", prompt, "内容") != key
+
+
+def test_repeated_generation_keeps_one_history_entry(mock_api):
+    content = long_content()[:200]
+    first, first_stats = core.generate_job(core.Job("generate"), "sk-test", "会议纪要", "", content, stream=False)
+    second, second_stats = core.generate_job(
+        core.Job("generate"), "sk-test", "会议纪要", "", content, history_id=first_stats["history_id"], stream=False
+    )
+    assert second_stats["cached"]
+    assert second_stats["history_id"] == first_stats["history_id"]
+    assert [entry["id"] for entry in core.get_history_store().recent(100) if entry["transcript"] == content] == [
+        first_stats["history_id"]
+    ]
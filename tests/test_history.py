@@ -0,0 +1,106 @@
+"""历史记录：不足 3 字的检索词走二字词索引，数万条记录下检索仍在 50 ms 内；相同简报不重复写入"""
+import random
+import sqlite3
+import time
+
+import pytest
+
+import briefing_core as core
+
+
+@pytest.fixture
+def store(tmp_path) -> core.HistoryStore:
+    return core.HistoryStore(str(tmp_path / "history.sqlite3"))
+
+
+def ids(rows: list) -> list:
+    return [row["id"] for row in rows]
+
+
+def test_short_terms_use_bigram_index(store):
+    first = store.add("本周项目预算需要调整。")
+    second = store.add("下周评审 API 方案", result="项目风险：预算不足")
+    store.add("与上述内容无关")
+    
+    assert ids(store.search("预算", 10)) == [second, first]
+    assert ids(store.search("项", 10)) == [second, first]
+    assert ids(store.search("算", 10)) == [second, first]
+    assert ids(store.search("风险 预算", 10)) == [second]
+    assert ids(store.search("api", 10)) == [second]
+    assert ids(store.search("需要调整 项目", 10)) == [first]
+    assert ids(store.search("不存", 10)) == []
+    assert "**预算**" in store.search("预算", 10)[0]["snippet"]
+    # 含标点的短词仍按子串匹配
+    assert ids(store.search("整。", 10)) == [first]
+
+
+def test_bigram_index_follows_updates_and_deletes(store):
+    entry_id = store.add("会议纪要")
+    store.attach_result(entry_id, "会议纪要", "会议纪要", "", "决定延期")
+    assert ids(store.search("延期", 10)) == [entry_id]
+    
+    store.delete(entry_id)
+    assert store.search("延期", 10) == []
+    assert store.search("会议", 10) == []
+
+
+def test_existing_database_is_backfilled(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    entry_id = core.HistoryStore(path).add("旧库中的预算记录")
+    db = sqlite3.connect(path)
+    db.executescript("""
+        DROP TRIGGER history_bigram_ai;
+        DROP TRIGGER history_bigram_ad;
+        DROP TRIGGER history_bigram_au;
+        DROP TABLE history_bigram;
+    """)
+    db.close()
+    
+    assert ids(core.HistoryStore(path).search("预算", 10)) == [entry_id]
+
+
+def test_repeated_briefing_is_not_duplicated(store):
+    entry_id = store.add("本周会议内容")
+    assert store.attach_result(entry_id, "本周会议内容", "会议纪要", "", "纪要") == entry_id
+    assert store.attach_result(entry_id, "本周会议内容", "会议纪要", "", "纪要") == entry_id
+    assert ids(store.recent(10)) == [entry_id]
+
+
+def test_cached_briefing_reuses_saved_entry(store):
+    entry_id = store.add("本周会议内容")
+    first = store.attach_result(entry_id, "本周会议内容", "会议纪要", "", "会议决定下周上线新版本")
+    second = store.attach_result(first, "本周会议内容", "工作日报", "", "今日完成上线准备工作")
+    assert second != first
+    
+    # 切回已生成过的类型：命中缓存时复用已保存的记录，否则另存
+    assert store.attach_result(second, "本周会议内容", "会议纪要", "", "会议决定下周上线新版本", cached=True) == first
+    assert len(store.recent(10)) == 2
+    assert store.attach_result(second, "本周会议内容", "会议纪要", "", "会议决定下周上线新版本") not in (first, second)
+
+
+@pytest.fixture(scope="module")
+def large_store(tmp_path_factory) -> core.HistoryStore:
+    rng = random.Random(0)
+    words = ["会议", "项目", "进度", "客户", "需求", "方案", "评审", "上线", "测试", "风险"]
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 300)]
+    store = core.HistoryStore(str(tmp_path_factory.mktemp("history") / "history.sqlite3"))
+    rows = [
+        (time.time(), "".join(rng.choice(words) + rng.choice(chars) + ("，" if rng.random() < 0.1 else "")
+                              for _ in range(150)))
+        for _ in range(20000)
+    ]
+    with store._lock:
+        store._db.executemany("INSERT INTO history (created, transcript) VALUES (?, ?)", rows)
+        store._db.commit()
+    return store
+
+
+@pytest.mark.parametrize("query", ["不存", "预算", "项目", "项", "预算调整", "项目 进度", "项目进度 会议"])
+def test_search_is_fast_on_large_history(large_store, query):
+    large_store.search(query, 50)
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        large_store.search(query, 50)
+        elapsed.append(time.perf_counter() - start)
+    assert min(elapsed) < 0.05
@@ -0,0 +1,55 @@
+"""后台任务池：清理过期任务须持锁，且不能误删刚结束、尚未写入结束时间的任务"""
+import threading
+import time
+
+import briefing_core as core
+
+
+def make_manager(retention: float = 0.0) -> core.JobManager:
+    return core.JobManager(max_workers=2, retention=retention)
+
+
+def test_prune_skips_jobs_without_finish_time():
+    manager = make_manager()
+    job = core.Job("test")
+    # 工作线程已写入状态、尚未写入结束时间
+    job.status = "done"
+    manager._jobs[job.id] = job
+    
+    manager._prune()
+    assert manager.get(job.id) is job
+    
+    job.finished = time.time() - 1
+    manager._prune()
+    assert manager.get(job.id) is None
+
+
+def test_prune_takes_manager_lock():
+    manager = make_manager()
+    job = core.Job("test")
+    job.status = "done"
+    job.finished = time.time() - 1
+    manager._jobs[job.id] = job
+    
+    with manager._lock:
+        worker = threading.Thread(target=manager._prune)
+        worker.start()
+        worker.join(0.2)
+        # 锁被占用时清理必须等待，不能并发修改任务表
+        assert worker.is_alive()
+        assert job.id in manager._jobs
+    worker.join(1)
+    assert job.id not in manager._jobs
+
+
+def test_submit_prunes_expired_jobs():
+    manager = make_manager()
+    first = manager.submit("test", lambda job: "ok")
+    deadline = time.time() + 5
+    while first.finished is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert first.result == "ok"
+    
+    second = manager.submit("test", lambda job: "ok")
+    assert manager.get(first.id) is None
+    assert manager.get(second.id) is second
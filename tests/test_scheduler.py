@@ -0,0 +1,87 @@
+"""调度器与熔断器：半开探测被取消后须交还探测名额"""
+import asyncio
+import time
+
+import pytest
+
+import briefing_core as core
+
+
+def make_scheduler(**overrides) -> core.RequestScheduler:
+    cfg = {**core.CONFIG['scheduler'], "breaker_cooldown": 0.05, **overrides}
+    return core.RequestScheduler(cfg)
+
+
+def half_open(scheduler: core.RequestScheduler):
+    breaker = scheduler.breaker
+    breaker.failures = breaker.threshold
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+    assert breaker.state == "half_open"
+
+
+async def hang():
+    await asyncio.sleep(3600)
+
+
+async def ok():
+    return "ok"
+
+
+def test_cancelled_probe_releases_half_open():
+    scheduler = make_scheduler()
+    half_open(scheduler)
+    
+    async def scenario():
+        probe = asyncio.ensure_future(scheduler.run("sk-test", hang))
+        await asyncio.sleep(0.01)
+        assert scheduler.breaker.probing
+        # 同时到达的其他请求快速失败
+        with pytest.raises(core.CircuitOpenError):
+            await scheduler.run("sk-test", ok)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not scheduler.breaker.probing
+        # 下一次调用重新探测，成功后熔断器闭合
+        return await scheduler.run("sk-test", ok)
+    
+    assert asyncio.run(scenario()) == "ok"
+    assert scheduler.breaker.state == "closed"
+
+
+def test_cancelled_stream_probe_releases_half_open():
+    scheduler = make_scheduler()
+    half_open(scheduler)
+    
+    async def stalled():
+        await asyncio.sleep(3600)
+        yield "never"
+    
+    async def consume():
+        async for _ in scheduler.stream("sk-test", stalled):
+            pass
+    
+    async def scenario():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        assert scheduler.breaker.probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    
+    asyncio.run(scenario())
+    assert not scheduler.breaker.probing
+    assert scheduler.breaker.state == "half_open"
+
+
+def test_probe_failure_reopens_breaker():
+    scheduler = make_scheduler(max_retries=0)
+    half_open(scheduler)
+    
+    async def down():
+        raise ConnectionError("connection refused")
+    
+    with pytest.raises(ConnectionError):
+        asyncio.run(scheduler.run("sk-test", down))
+    assert scheduler.breaker.state == "open"
+    assert not scheduler.breaker.probing
@@ -0,0 +1,120 @@
+"""共享后端：Redis 替身上的共享限流与缓存，后端不可用时退回进程内行为"""
+import asyncio
+import socket
+import time
+
+import pytest
+
+import briefing_core as core
+import mock_redis
+
+
+@pytest.fixture
+def redis_url():
+    server, state, url = mock_redis.start_server()
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dead_url():
+    # 取一个刚释放的端口，连接会被拒绝
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"redis://127.0.0.1:{port}/0"
+
+
+class SlowBackend(core.MemoryBackend):
+    """写入耗时的后端，模拟缓慢的 Redis"""
+    
+    shared = True
+    
+    def set(self, key, value, ttl=None):
+        time.sleep(0.3)
+        super().set(key, value, ttl)
+
+
+def test_shared_limiter_pause_is_seen_by_other_replicas(redis_url):
+    backend = core.RedisBackend(redis_url, prefix="test:")
+    first = core.SharedRateLimiter(backend, "sk-test", rate=5, burst=10)
+    second = core.SharedRateLimiter(core.RedisBackend(redis_url, prefix="test:"), "sk-test", rate=5, burst=10)
+    
+    async def scenario():
+        assert await first.acquire() == 0.0
+        await first.pause(5)
+        return await second._try_acquire()
+    
+    assert 4 < asyncio.run(scenario()) <= 5
+
+
+def test_shared_limiter_counts_across_replicas(redis_url):
+    limiters = [
+        core.SharedRateLimiter(core.RedisBackend(redis_url, prefix="test:"), "sk-test", rate=1, burst=2)
+        for _ in range(2)
+    ]
+    
+    # 避开窗口边界，保证四次请求落在同一窗口
+    window = limiters[0].window
+    if time.time() % window > window - 0.5:
+        time.sleep(window - time.time() % window)
+    
+    async def scenario():
+        return [await limiter._try_acquire() for limiter in limiters + limiters]
+    
+    delays = asyncio.run(scenario())
+    # 两个副本在同一窗口内合计只放行 burst 个
+    assert delays[:2] == [0.0, 0.0]
+    assert all(delay > 0 for delay in delays[2:])
+
+
+def test_pause_does_not_block_event_loop():
+    limiter = core.SharedRateLimiter(SlowBackend(), "sk-test", rate=5, burst=10)
+    
+    async def scenario():
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        task = asyncio.ensure_future(ticker())
+        await limiter.pause(1)
+        task.cancel()
+        return ticks
+    
+    assert asyncio.run(scenario()) >= 10
+
+
+def test_unreachable_backend_falls_back(dead_url):
+    backend = core.RedisBackend(dead_url, prefix="test:", timeout=0.2)
+    with pytest.raises(core.SharedBackendError):
+        backend.ping()
+    
+    # 限流退回本副本令牌桶，429 暂停不抛错
+    limiter = core.SharedRateLimiter(backend, "sk-test", rate=5, burst=10)
+    
+    async def scenario():
+        waited = await limiter.acquire()
+        await limiter.pause(0.01)
+        return waited
+    
+    assert asyncio.run(scenario()) == 0.0
+    
+    # 缓存读写视为未命中 / 忽略，仍使用内存层
+    assert core.shared_get_json(backend, "missing") is None
+    core.shared_set_json(backend, "key", {"a": 1})
+    cache = core.TranscriptionCache(8, 1024 * 1024, backend=backend)
+    cache.set("k", {"text": "内容", "segments": []})
+    assert cache.get("k")["text"] == "内容"
+    
+    # 调度器照常执行请求
+    scheduler = core.RequestScheduler(core.CONFIG['scheduler'], backend)
+    
+    async def ok():
+        return "ok"
+    
+    assert asyncio.run(scheduler.run("sk-test", ok)) == "ok"